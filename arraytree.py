@@ -0,0 +1,210 @@
+from __future__ import absolute_import, division, print_function
+import random
+import sys
+import time
+import numpy as np
+from mcts import MCTS, BUDGET
+
+# node states
+OPEN = 0
+WON = 1  # the move into the node won the game
+DRAWN = 2  # no move left on the board
+
+
+# the search tree as a struct of arrays: node i is described by the i-th entry of every array
+# nodes do not keep a board, the board of a node is rebuilt by playing the moves on the path to it
+# the children of a node are reserved as one block the first time the node needs them, with their moves
+# filled in from the move generator. that block doubles as the node's list of unexpanded options:
+# children first_child .. first_child + expanded - 1 exist, the rest of the block is still to be expanded
+# (so a child's next sibling is simply the next id)
+class ArrayTree:
+    # tree constructor. the arrays start with room for capacity nodes and double when they are full
+    def __init__(self, capacity=1024):
+        self.visits = np.zeros(capacity, np.int32)
+        self.wins = np.zeros(capacity, np.int32)
+        self.parent = np.full(capacity, -1, np.int32)
+        self.move = np.zeros(capacity, np.int16)
+        self.first_child = np.full(capacity, -1, np.int32)
+        self.child_count = np.zeros(capacity, np.int16)
+        self.expanded = np.zeros(capacity, np.int16)
+        self.state = np.zeros(capacity, np.int8)
+        # node 0 is the root
+        self.size = 1
+
+    # the arrays, in one place so that growing and measuring them does not miss one
+    def arrays(self):
+        return ('visits', 'wins', 'parent', 'move', 'first_child', 'child_count', 'expanded', 'state')
+
+    # make room for at least needed nodes
+    def grow(self, needed):
+        capacity = len(self.visits)
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        for name in self.arrays():
+            old = getattr(self, name)
+            new = np.zeros(capacity, old.dtype)
+            if name in ('parent', 'first_child'):
+                new.fill(-1)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    # reserve the block of children of node, one per move (bit indices)
+    def reserve(self, node, moves):
+        first = self.size
+        self.grow(first + len(moves))
+        self.move[first:first + len(moves)] = moves
+        self.parent[first:first + len(moves)] = node
+        self.first_child[node] = first
+        self.child_count[node] = len(moves)
+        self.size = first + len(moves)
+
+    # bytes used by one node over all the arrays
+    def bytes_per_node(self):
+        return sum(getattr(self, name).itemsize for name in self.arrays())
+
+
+# MCTS on an ArrayTree: the same search as mcts.MCTS (expansion in option order, the same UCB formula
+# and argmax(Q / N) decision) with a far smaller tree, so larger budgets fit in memory
+# the UCB scores of a node's children are computed in one go with NumPy
+class ArrayMCTS:
+    # constructor of an array-backed search. grid is a BitBoard, budget defaults to BUDGET
+    def __init__(self, grid, player, budget=None):
+        self.initial_board = grid
+        self.ai_role = player
+        self.budget = budget
+        self.tree = None
+        self.iterations = 0
+        self.rollouts = 0
+
+    # high level interface, same as MCTS.uct_search
+    def uct_search(self):
+        self.build_tree()
+        return self.best_move()
+
+    # runs the search loop for the whole budget and returns the tree
+    def build_tree(self):
+        self.tree = ArrayTree()
+        board = self.initial_board.copy()
+        budget = self.budget if self.budget is not None else BUDGET
+        self.iterations = 0
+        for i in range(0, budget):
+            self.iteration(board)
+            self.iterations += 1
+        return self.tree
+
+    # one selection, expansion, simulation and back propagation on board, which is left as it was
+    def iteration(self, board):
+        tree = self.tree
+        other = {'b': 'w', 'w': 'b'}
+        stride = board.stride
+        node = 0
+        path = [0]
+        piece = self.ai_role  # the player to move at node
+        while tree.state[node] == OPEN:
+            if tree.first_child[node] < 0:
+                options = board.get_options()
+                if not options:
+                    tree.state[node] = DRAWN
+                    break
+                tree.reserve(node, [r * stride + c for r, c in options])
+            first = tree.first_child[node]
+            if tree.expanded[node] < tree.child_count[node]:
+                # expand the next option of the block
+                child = first + int(tree.expanded[node])
+                tree.expanded[node] += 1
+                node = child
+                expanding = True
+            else:
+                node = self.best_child(node)
+                expanding = False
+            r, c = divmod(int(tree.move[node]), stride)
+            board.set_piece(r, c, piece)
+            path.append(node)
+            if expanding and board.check_win(r, c):
+                tree.state[node] = WON
+            piece = other[piece]
+            if expanding:
+                break
+        # simulate a game to the end
+        if tree.state[node] == WON:
+            result = other[piece]
+        elif tree.state[node] == DRAWN:
+            result = 'd'
+        else:
+            result = board.random_playout(piece)
+            self.rollouts += 1
+        # update the path. as in MCTS, a node is rewarded when its player to move did not win
+        piece = self.ai_role
+        for k in range(len(path)):
+            node = path[k]
+            tree.visits[node] += 1
+            if result == piece:
+                tree.wins[node] -= 1
+            else:
+                tree.wins[node] += 1
+            piece = other[piece]
+        for k in range(len(path) - 1):
+            board.undo()
+
+    # argmax (Q / N + c * sqrt(ln(N) / N)) over all the children of a fully expanded node at once
+    def best_child(self, parent):
+        tree = self.tree
+        first = tree.first_child[parent]
+        count = tree.child_count[parent]
+        visits = tree.visits[first:first + count]
+        scores = tree.wins[first:first + count] / visits + 2 * np.sqrt(np.log(tree.visits[parent]) / visits)
+        return first + int(np.argmax(scores))
+
+    # the move the search would make, the child of the root with the formula: argmax(Q / N)
+    def best_move(self):
+        tree = self.tree
+        first = tree.first_child[0]
+        if first < 0 or tree.expanded[0] == 0:
+            return None
+        count = tree.expanded[0]
+        index = first + int(np.argmax(tree.wins[first:first + count] / tree.visits[first:first + count]))
+        return list(divmod(int(tree.move[index]), self.initial_board.stride))
+
+
+# rough size of a State node with everything it owns (board, lists, tuples)
+def state_bytes(state):
+    size = sys.getsizeof(state) + sys.getsizeof(state.__dict__)
+    grid = state.grid
+    size += sys.getsizeof(grid) + sys.getsizeof(grid.__dict__) + sys.getsizeof(grid.bits)
+    size += sys.getsizeof(grid.moves) + sys.getsizeof(grid.frontiers)
+    size += sys.getsizeof(state.children) + sys.getsizeof(state.options)
+    size += sum(sys.getsizeof(option) for option in state.options)
+    return size
+
+
+# benchmark: time and memory per node of the two tree representations
+# usage: python arraytree.py [budget]
+if __name__ == '__main__':
+    from bitboard import BitBoard
+    budget = int(sys.argv[1]) if len(sys.argv) > 1 else BUDGET
+    board = BitBoard(11)
+    for r, c, piece in ((5, 5, 'b'), (5, 6, 'w'), (4, 4, 'b'), (6, 6, 'w')):
+        board.set_piece(r, c, piece)
+    random.seed(1)
+    started = time.time()
+    search = MCTS(board, 'b', budget=budget)
+    root_state = search.build_tree()
+    elapsed = time.time() - started
+    nodes, total = 0, 0
+    pending = [root_state]
+    while pending:
+        state = pending.pop()
+        nodes += 1
+        total += state_bytes(state)
+        pending.extend(state.children)
+    print("State tree: {0} nodes, {1:.0f} bytes/node, {2:.2f}s, move {3}".format(
+        nodes, total / nodes, elapsed, search.best_move()))
+    random.seed(1)
+    started = time.time()
+    search = ArrayMCTS(board, 'b', budget=budget)
+    tree = search.build_tree()
+    elapsed = time.time() - started
+    print("ArrayTree: {0} nodes ({1} expanded), {2} bytes/node, {3:.2f}s, move {4}".format(
+        tree.size, int(tree.expanded[:tree.size].sum()) + 1, tree.bytes_per_node(), elapsed, search.best_move()))
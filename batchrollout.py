@@ -0,0 +1,161 @@
+from __future__ import absolute_import, division, print_function
+import random
+import sys
+import time
+import numpy as np
+
+EMPTY = 0
+BLACK = 1
+WHITE = 2
+CODES = {'b': BLACK, 'w': WHITE}
+COLORS = {BLACK: 'b', WHITE: 'w'}
+# the longest winning run: a line of 2 * length - 1 spots is packed into an int32, and the table of the
+# winning lines has 2 ** (2 * length - 1) entries
+MAX_LENGTH = 10
+
+
+# plays many independent random games at once. the games are one int8 array of shape (K, size, size)
+# and every step makes one move in every unfinished game with whole-array operations:
+# the candidates are the empty spots in each game's bounding box grown by radius (the default rule of
+# the move generator), looked up as the and of a row band and a column band mask; a random candidate is
+# picked per game by taking the argmax of random scores; and five in a row is found by gathering the four
+# lines through the new piece from precomputed index tables, packing each line into a number and
+# looking it up in a table of the lines that hold a winning run
+# the set-up of every step is paid once per batch, so small batches are slower than playing the games
+# one at a time: about half the speed with 8 games, the same with 32, twice as fast from 64
+class BatchRollout:
+    # engine constructor. seed makes the games reproducible
+    def __init__(self, size=11, length=5, radius=1, seed=None):
+        if length > MAX_LENGTH:
+            raise ValueError("runs of {0} are too long for batched games, at most {1}".format(length, MAX_LENGTH))
+        self.size = size
+        self.length = length
+        self.radius = radius
+        self.rng = np.random.default_rng(seed)
+        self.moves = 0
+        cells = size * size
+        rows = np.arange(cells) // size
+        columns = np.arange(cells) % size
+        # bands[a, b] has the spots of rows a..b (or columns a..b) set
+        low = np.arange(size)[:, None, None]
+        high = np.arange(size)[None, :, None]
+        self.row_bands = (rows >= low) & (rows <= high)
+        self.column_bands = (columns >= low) & (columns <= high)
+        # for every spot, the spots of the four lines through it, length - 1 on each side.
+        # the games are stored with one extra spot after the board that never holds a piece,
+        # and the spots off the board point at it
+        span = np.arange(-(length - 1), length)
+        self.line_index = np.zeros((cells, 4, len(span)), np.intp)
+        for d, (dr, dc) in enumerate(((0, 1), (1, 0), (1, 1), (1, -1))):
+            line_r = rows[:, None] + dr * span
+            line_c = columns[:, None] + dc * span
+            valid = (line_r >= 0) & (line_r < size) & (line_c >= 0) & (line_c < size)
+            self.line_index[:, d] = np.where(valid, line_r * size + line_c, cells)
+        # a line of 2 * length - 1 spots packed into a number, bit k for spot k, and whether it holds a run
+        self.line_bits = (1 << np.arange(len(span))).astype(np.int32)
+        run = (1 << length) - 1
+        codes = np.arange(1 << len(span), dtype=np.int32)
+        self.winning = np.zeros(len(codes), bool)
+        for k in range(length):
+            self.winning |= (codes >> k) & run == run
+
+    # play a random game to the end from every board, with players[k] to move on boards[k]
+    # boards are BitBoards. returns the winners' colors, 'd' for a draw
+    def play(self, boards, players):
+        count = len(boards)
+        size = self.size
+        grid = np.zeros((count, size, size), np.int8)
+        for k, board in enumerate(boards):
+            for piece in ('b', 'w'):
+                for i in board.indices(board.bits[piece]):
+                    r, c = divmod(i, board.stride)
+                    grid[k, r, c] = CODES[piece]
+        turn = np.array([CODES[player] for player in players], np.int8)
+        return [COLORS.get(code, 'd') for code in self.play_grids(grid, turn)]
+
+    # the same on an array of games, with turn[k] the code of the player to move in game k
+    # returns an array of the winners' codes, 0 for a draw. grid is not modified
+    # the number of moves played over all the games is left in moves
+    def play_grids(self, grid, turn):
+        count, size = grid.shape[0], self.size
+        cells = size * size
+        # the board plus the spare spot the lines point at when they leave the board
+        games = np.zeros((count, cells + 1), np.int8)
+        games[:, :cells] = grid.reshape(count, -1)
+        turn = turn.copy()
+        winners = np.zeros(count, np.int8)
+        # the numbers of the games still being played, the rows of the working arrays
+        ids = np.arange(count)
+        # each game's bounding box, grown by radius and clipped to the board
+        occupied = games[:, :cells] != EMPTY
+        rows_used = occupied.reshape(count, size, size).any(axis=2)
+        columns_used = occupied.reshape(count, size, size).any(axis=1)
+        radius = self.radius
+        min_r = np.maximum(np.argmax(rows_used, axis=1) - radius, 0)
+        max_r = np.minimum(size - 1 - np.argmax(rows_used[:, ::-1], axis=1) + radius, size - 1)
+        min_c = np.maximum(np.argmax(columns_used, axis=1) - radius, 0)
+        max_c = np.minimum(size - 1 - np.argmax(columns_used[:, ::-1], axis=1) + radius, size - 1)
+        # an empty board only gets the center
+        empty = ~rows_used.any(axis=1)
+        min_r[empty] = max_r[empty] = min_c[empty] = max_c[empty] = size // 2
+        # games that finished but are still in the working arrays, waiting to be dropped
+        live = np.ones(count, bool)
+        rows = np.arange(count)
+        self.moves = 0
+        while len(ids):
+            candidates = self.row_bands[min_r, max_r] & self.column_bands[min_c, max_c] & (games[:, :cells] == EMPTY)
+            candidates &= live[:, None]
+            # random 16 bit scores (never 0), zeroed outside the candidates
+            scores = np.frombuffer(self.rng.bytes(2 * candidates.size), np.uint16).reshape(candidates.shape) | 1
+            scores *= candidates
+            picks = np.argmax(scores, axis=1)
+            # no candidate left means a full board, a draw
+            playing = candidates[rows, picks]
+            games[rows[playing], picks[playing]] = turn[playing]
+            self.moves += int(np.count_nonzero(playing))
+            # the lines through the new pieces, and the mover's runs on them
+            lines = np.take(games, self.line_index[picks] + (rows * (cells + 1))[:, None, None]) == turn[:, None, None]
+            codes = np.einsum('ijk,k->ij', lines.view(np.int8), self.line_bits, dtype=np.int32)
+            won = self.winning[codes].any(axis=1) & playing
+            winners[ids[won]] = turn[won]
+            live &= playing & ~won
+            # grow the boxes around the new pieces
+            pick_r, pick_c = picks // size, picks % size
+            min_r = np.minimum(min_r, np.maximum(pick_r - radius, 0))
+            max_r = np.maximum(max_r, np.minimum(pick_r + radius, size - 1))
+            min_c = np.minimum(min_c, np.maximum(pick_c - radius, 0))
+            max_c = np.maximum(max_c, np.minimum(pick_c + radius, size - 1))
+            turn = 3 - turn
+            # drop the finished games from the working arrays once enough of them are done to be worth the copy
+            if np.count_nonzero(live) * 2 <= len(ids):
+                keep = live
+                ids, games, turn, live = ids[keep], games[keep], turn[keep], live[keep]
+                min_r, max_r, min_c, max_c = min_r[keep], max_r[keep], min_c[keep], max_c[keep]
+                rows = np.arange(len(ids))
+        return winners
+
+
+# benchmark: random playouts per second, one at a time on a BitBoard against batches of K games
+# usage: python batchrollout.py [K]
+if __name__ == '__main__':
+    from bitboard import BitBoard
+    batch = int(sys.argv[1]) if len(sys.argv) > 1 else 256
+    board = BitBoard(11)
+    for r, c, piece in ((5, 5, 'b'), (5, 6, 'w'), (4, 4, 'b'), (6, 6, 'w')):
+        board.set_piece(r, c, piece)
+    random.seed(1)
+    started = time.time()
+    games = 0
+    while time.time() - started < 2:
+        board.random_playout('b')
+        games += 1
+    scalar = games / (time.time() - started)
+    engine = BatchRollout(11, seed=1)
+    started = time.time()
+    games = 0
+    while time.time() - started < 2:
+        engine.play([board] * batch, ['b'] * batch)
+        games += batch
+    batched = games / (time.time() - started)
+    print("scalar: {0:.0f} playouts/s, batch of {1}: {2:.0f} playouts/s, {3:.1f}x".format(
+        scalar, batch, batched, batched / scalar))
@@ -0,0 +1,144 @@
+from __future__ import absolute_import, division, print_function
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+from config import GameConfig
+from mcts import MCTS, State
+from policy import ThreatPolicy
+from tournament import play_game
+
+# one recorded random game on 11x11 with no five in a row. the early, mid and late positions are its first
+# moves. on larger boards the game is moved to the middle of the board, smaller ones cannot hold it
+GAME = [(5, 5), (6, 5), (4, 4), (5, 4), (7, 6), (6, 3), (8, 7), (6, 4), (8, 4), (7, 2), (8, 8), (4, 6),
+        (7, 5), (3, 9), (6, 2), (3, 8), (3, 3), (7, 1), (5, 6), (9, 10), (10, 9), (3, 10), (6, 8), (3, 1),
+        (2, 9), (5, 9), (8, 5), (9, 8), (2, 1), (6, 7), (8, 1), (5, 8), (4, 0), (10, 3), (9, 3), (8, 9),
+        (10, 1), (4, 10), (1, 7), (9, 5), (0, 1), (1, 1), (6, 10), (0, 0), (9, 1), (5, 2), (3, 6), (5, 3),
+        (0, 10), (2, 8), (3, 5), (4, 2), (2, 2), (9, 6), (1, 4), (1, 3), (7, 0), (10, 8), (0, 8), (2, 7)]
+PHASES = (('early', 6), ('mid', 30), ('late', 60))
+SEED = 1
+# the smallest board the positions fit on
+MIN_SIZE = 11
+# a case is slower than the baseline when its time grows by more than this fraction
+THRESHOLD = 0.15
+
+
+# the position after the first plies moves of GAME on a board of the given size, black to move as plies is even
+def position(plies, size=11):
+    if size < MIN_SIZE:
+        raise ValueError("the benchmark positions need a board of at least {0}x{0}".format(MIN_SIZE))
+    board = GameConfig(size).new_board()
+    offset = (size - 11) // 2
+    piece = 'b'
+    for r, c in GAME[:plies]:
+        board.set_piece(r + offset, c + offset, piece)
+        piece = 'w' if piece == 'b' else 'b'
+    return board
+
+
+# the benchmark cases on a size x size board as (name, operations per call, function)
+# the names end with the size, e.g. rollout/mid@15. every call does the same work
+def cases(budgets, size=11):
+    found = []
+    for phase, plies in PHASES:
+        board = position(plies, size)
+        root = State()
+        root.constructor_params(board, 'b')
+        options = board.get_options()
+        pieces = [board.coords(i) for i in board.moves]
+        found.append(('get_options/' + phase, 1, board.get_options))
+        found.append(('check_win/' + phase, len(pieces),
+                      lambda board=board, pieces=pieces: [board.check_win(r, c) for r, c in pieces]))
+        found.append(('constructor_move/' + phase, len(options),
+                      lambda root=root, options=options: [State().constructor_move(root, move) for move in options]))
+        found.append(('rollout/' + phase, 1, lambda board=board: board.random_playout('b')))
+        found.append(('threat_rollout/' + phase, 1, lambda board=board: ThreatPolicy().playout(board, 'b')))
+    board = position(PHASES[1][1], size)
+    for budget in budgets:
+        found.append(('uct_search/' + str(budget), budget,
+                      lambda budget=budget: MCTS(board, 'b', budget=budget).uct_search()))
+    found.append(('game/mcts:50', 1, lambda: play_game('mcts:50', 'mcts:50', SEED, size)))
+    return [(name + '@' + str(size), operations, function) for name, operations, function in found]
+
+
+# time one case: a first untimed pass finds how many calls take about min_time / rounds seconds,
+# then every round makes that many calls after seeding the random generator, so the rounds (and the runs)
+# play exactly the same random games
+# returns the seconds per operation of the fastest and the median round, and the calls per round
+def measure(function, operations, rounds=5, min_time=0.5):
+    random.seed(SEED)
+    calls = 0
+    started = time.time()
+    while time.time() - started < min_time / rounds:
+        function()
+        calls += 1
+    times = []
+    for round in range(rounds):
+        random.seed(SEED)
+        started = time.time()
+        for call in range(calls):
+            function()
+        times.append((time.time() - started) / (calls * operations))
+    times.sort()
+    return {'best': times[0], 'median': times[len(times) // 2], 'calls': calls}
+
+
+# run the cases for every board size whose names start with one of the prefixes (all of them without prefixes)
+def run(budgets, prefixes=None, rounds=5, min_time=0.5, sizes=(11,), output=sys.stderr):
+    results = {}
+    for name, operations, function in [case for size in sizes for case in cases(budgets, size)]:
+        if prefixes and not any(name.startswith(prefix) for prefix in prefixes):
+            continue
+        results[name] = measure(function, operations, rounds, min_time)
+        output.write("{0:28} {1:12.3f} us/op\n".format(name, results[name]['best'] * 1e6))
+    return {'python': platform.python_version(), 'machine': platform.machine(), 'seed': SEED,
+            'time': time.time(), 'cases': results}
+
+
+# the cases of report that are more than threshold slower than in baseline, as (name, ratio) pairs
+# the fastest rounds are compared, as they are the least disturbed by the rest of the machine. cases missing from either side are skipped
+def regressions(report, baseline, threshold=THRESHOLD, output=sys.stderr):
+    slower = []
+    for name in sorted(report['cases']):
+        if name not in baseline['cases']:
+            continue
+        ratio = report['cases'][name]['best'] / baseline['cases'][name]['best']
+        flag = 'SLOWER' if ratio > 1 + threshold else ('faster' if ratio < 1 - threshold else '')
+        output.write("{0:28} {1:7.2f}x {2}\n".format(name, ratio, flag))
+        if ratio > 1 + threshold:
+            slower.append((name, ratio))
+    return slower
+
+
+# command line entry point, e.g.
+#   python benchmark.py --output baseline.json
+#   python benchmark.py --compare baseline.json
+# with --compare the exit status is 1 if a case got slower
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Time the engine's hot paths on fixed positions.")
+    parser.add_argument('cases', nargs='*', help="only run the cases starting with these names, e.g. rollout")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[11], help="board sizes, e.g. 11 15 19")
+    parser.add_argument('--budgets', type=int, nargs='+', default=[100, 400, 1600], help="uct_search budgets")
+    parser.add_argument('--rounds', type=int, default=5, help="timed rounds per case")
+    parser.add_argument('--min-time', type=float, default=0.5, help="seconds spent on each case at least")
+    parser.add_argument('--output', default=None, help="file for the JSON report (default: stdout)")
+    parser.add_argument('--compare', default=None, help="baseline JSON report to check for regressions")
+    parser.add_argument('--threshold', type=float, default=THRESHOLD, help="slowdown that counts as a regression")
+    args = parser.parse_args()
+    if min(args.sizes) < MIN_SIZE:
+        parser.error("the benchmark positions need boards of at least {0}x{0}".format(MIN_SIZE))
+    report = run(args.budgets, args.cases, args.rounds, args.min_time, args.sizes)
+    if args.output:
+        with open(args.output, 'w') as stream:
+            json.dump(report, stream, indent=2, sort_keys=True)
+    else:
+        print(json.dumps(report, indent=2, sort_keys=True))
+    if args.compare:
+        with open(args.compare) as stream:
+            baseline = json.load(stream)
+        slower = regressions(report, baseline, args.threshold)
+        if slower:
+            sys.stderr.write("{0} regression(s): {1}\n".format(len(slower), ', '.join(name for name, _ in slower)))
+            sys.exit(1)
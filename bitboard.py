@@ -0,0 +1,247 @@
+from __future__ import absolute_import, division, print_function
+import random
+from movegen import default_generator
+from wincheck import default_detector
+from zobrist import default_keys
+
+EMPTY = '.'
+
+
+# a compact game board shared by the GUI, the random player and the MCTS nodes
+# every color is stored as one python integer with one bit per cell, so copying a board
+# is copying two integers and the rules below are plain bit operations
+# cell (r, c) lives on bit r * stride + c. each row has one spare (always empty) column at its end,
+# which stops the shifts used for the win check from wrapping from one row into the next
+class BitBoard:
+    # board constructor. the board starts empty
+    # movegen decides which spots get_options returns, see movegen.py. length pieces in a row win
+    # config.GameConfig makes boards from the game's rules
+    def __init__(self, size=11, movegen=None, length=5):
+        self.size = size
+        self.stride = size + 1
+        self.bits = {'b': 0, 'w': 0}
+        self.occupied = 0
+        # indices of the pieces in the order they were set, so that moves can be taken back
+        self.moves = []
+        self.movegen = movegen or default_generator(size)
+        # the five-in-a-row rule, see wincheck.py
+        self.wins = default_detector(size, length)
+        # the Zobrist hash of the pieces, updated on every placement, see zobrist.py
+        self.zobrist = default_keys(size)
+        self.hash = 0
+        # the move generator's state, updated on every placement,
+        # and its previous values so that undo can restore them
+        self.frontier = self.movegen.start()
+        self.frontiers = []
+        # one bit at column 0 of every row. multiplying a row pattern by it repeats the pattern on every row
+        self.column_fill = 0
+        for r in range(size):
+            self.column_fill |= 1 << (r * self.stride)
+        # one bit on every real cell of the board
+        self.full = ((1 << size) - 1) * self.column_fill
+
+    # a cheap copy: the bits and frontiers are immutable, only the move lists need their own copies
+    # if a different move generator is given, its frontier is rebuilt from the moves
+    def copy(self, movegen=None):
+        other = BitBoard.__new__(BitBoard)
+        other.size = self.size
+        other.stride = self.stride
+        other.bits = {'b': self.bits['b'], 'w': self.bits['w']}
+        other.occupied = self.occupied
+        other.moves = list(self.moves)
+        other.column_fill = self.column_fill
+        other.full = self.full
+        other.wins = self.wins
+        other.zobrist = self.zobrist
+        other.hash = self.hash
+        if movegen is None or movegen is self.movegen:
+            other.movegen = self.movegen
+            other.frontier = self.frontier
+            other.frontiers = list(self.frontiers)
+        else:
+            other.movegen = movegen
+            other.frontier = movegen.start()
+            other.frontiers = []
+            for i in self.moves:
+                other.frontiers.append(other.frontier)
+                other.frontier = movegen.advance(other.frontier, i)
+        return other
+
+    # boards are sent to worker processes. the shared tables are not pickled,
+    # the other side picks up its own copies of the default ones
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        if self.movegen is default_generator(self.size):
+            state['movegen'] = None
+        state['wins'] = self.wins.length
+        del state['zobrist']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.movegen is None:
+            self.movegen = default_generator(self.size)
+        self.wins = default_detector(self.size, state['wins'])
+        self.zobrist = default_keys(self.size)
+
+    # build a board from the old list of lists representation
+    @classmethod
+    def from_grid(cls, grid, length=5):
+        board = cls(len(grid), length=length)
+        for r in range(len(grid)):
+            for c in range(len(grid)):
+                if grid[r][c] != EMPTY:
+                    board.set_piece(r, c, grid[r][c])
+        return board
+
+    # the number of pieces in a row that wins
+    @property
+    def length(self):
+        return self.wins.length
+
+    # the list of lists representation of the board, mostly useful for printing
+    def to_grid(self):
+        return [[self.get(r, c) for c in range(self.size)] for r in range(self.size)]
+
+    # the key of this position with player to move, for the transposition table
+    def key(self, player):
+        if player == 'w':
+            return self.hash ^ self.zobrist.side
+        return self.hash
+
+    # convert between (row, column) and bit index
+    def index(self, r, c):
+        return r * self.stride + c
+
+    def coords(self, i):
+        return divmod(i, self.stride)
+
+    # the color at (r, c), or '.' if the spot is empty
+    def get(self, r, c):
+        bit = 1 << (r * self.stride + c)
+        if self.bits['b'] & bit:
+            return 'b'
+        if self.bits['w'] & bit:
+            return 'w'
+        return EMPTY
+
+    # put a piece of the given color at (r, c). returns False if the spot is taken
+    def set_piece(self, r, c, piece):
+        i = r * self.stride + c
+        bit = 1 << i
+        if self.occupied & bit:
+            return False
+        self.bits[piece] |= bit
+        self.occupied |= bit
+        self.moves.append(i)
+        self.frontiers.append(self.frontier)
+        self.frontier = self.movegen.advance(self.frontier, i)
+        self.hash ^= self.zobrist.keys[piece][i]
+        return True
+
+    # take back the last piece that was set
+    def undo(self):
+        i = self.moves.pop()
+        self.frontier = self.frontiers.pop()
+        bit = 1 << i
+        self.occupied ^= bit
+        if self.bits['b'] & bit:
+            self.bits['b'] ^= bit
+            self.hash ^= self.zobrist.keys['b'][i]
+        else:
+            self.bits['w'] ^= bit
+            self.hash ^= self.zobrist.keys['w'][i]
+
+    # empty the board
+    def clear(self):
+        self.bits = {'b': 0, 'w': 0}
+        self.occupied = 0
+        self.moves = []
+        self.frontier = self.movegen.start()
+        self.frontiers = []
+        self.hash = 0
+
+    # checks if the piece at (r, c) is part of five in a row
+    def check_win(self, r, c):
+        piece = self.get(r, c)
+        if piece == EMPTY:
+            return False
+        return self.wins.is_win(self.bits[piece], r * self.stride + c)
+
+    # the two ends of the winning line through (r, c), or None if the piece there has not won
+    def winning_line(self, r, c):
+        piece = self.get(r, c)
+        if piece == EMPTY:
+            return None
+        return self.wins.winning_line(self.bits[piece], r, c)
+
+    # the candidate next moves chosen by the move generator, in its order
+    # the generator keeps its frontier up to date on every placement, so there is no board scan here
+    # returns an empty list if the board is full
+    def get_options(self):
+        # At the beginning of the game, only the center makes sense
+        if not self.occupied:
+            return [(self.size // 2, self.size // 2)]
+        indices = self.indices(self.movegen.reach(self.frontier) & ~self.occupied)
+        return [divmod(i, self.stride) for i in self.movegen.arrange(indices, self.moves)]
+
+    # plays random moves for both sides, starting with piece, until someone wins or the board is full
+    # the game is played on this board and the old position is restored at the end, so nothing is
+    # allocated per move. the candidate moves are kept in a list that only gets the spots newly
+    # reached by the move generator's frontier, instead of being rebuilt from the whole board every move
+    # returns the winner's color, or 'd' for a draw. the number of moves played is left in playout_length
+    def random_playout(self, piece):
+        stride = self.stride
+        movegen = self.movegen
+        bits = self.bits
+        saved = (bits['b'], bits['w'], self.occupied, self.frontier)
+        occupied = self.occupied
+        frontier = self.frontier
+        reach = movegen.reach(frontier)
+        if occupied:
+            candidates = self.indices(reach & ~occupied)
+        else:
+            candidates = [(self.size // 2) * stride + self.size // 2]
+        other = {'b': 'w', 'w': 'b'}
+        is_win = self.wins.is_win
+        randrange = random.randrange
+        winner = 'd'
+        try:
+            while candidates:
+                # pick a random candidate and remove it from the list by swapping with the last one
+                k = randrange(len(candidates))
+                i = candidates[k]
+                candidates[k] = candidates[-1]
+                candidates.pop()
+                bit = 1 << i
+                x = bits[piece] | bit
+                bits[piece] = x
+                occupied |= bit
+                if is_win(x, i):
+                    winner = piece
+                    break
+                # add the spots that the new piece brought within reach
+                frontier = movegen.advance(frontier, i)
+                new_reach = movegen.reach(frontier)
+                if new_reach != reach:
+                    candidates.extend(self.indices(new_reach & ~reach & ~occupied))
+                    reach = new_reach
+                piece = other[piece]
+        finally:
+            self.playout_length = bin(occupied ^ saved[2]).count('1')
+            # restore the position the playout started from
+            bits['b'], bits['w'], self.occupied, self.frontier = saved
+        return winner
+
+    # list the (row, column) of every bit in a mask, in raster order
+    def cells(self, mask):
+        return [divmod(i, self.stride) for i in self.indices(mask)]
+
+    # list the index of every bit in a mask, in increasing order
+    def indices(self, mask):
+        result = []
+        while mask:
+            low = mask & -mask
+            result.append(low.bit_length() - 1)
+            mask ^= low
+        return result
@@ -1,23 +1,41 @@
 from __future__ import print_function
 import pygame
-from randplay import *
-from mcts import *
+from config import GameConfig
+from randplay import Randplay
+from searchworker import BackgroundSearch
+
+
+# the distance between the first and the last line of the board, in pixels
+BOARD_PIXELS = 460
+# the pygame event that brings the replies of the background search, see Board.ai_event
+AI_EVENT = pygame.USEREVENT + 1
 
 
 class Board:
-    # board object constructor
-    def __init__(self):
-        self.grid_size = 46
+    # board object constructor. config is the game's GameConfig, 11x11 and five in a row by default
+    def __init__(self, config=None):
+        self.config = config or GameConfig()
+        self.grid_count = self.config.size
+        # the spacing of the lines in pixels, so that any board size fits the same window
+        self.grid_size = BOARD_PIXELS // (self.grid_count - 1)
         self.start_x, self.start_y = 38, 55  # the starting pixels of the board
         self.edge_size = self.grid_size // 2
-        self.grid_count = 11
         self.piece = 'b'  # the color of the current player
         self.winner = None
         self.game_over = False
-        self.grid = []  # a 2D array
+        self.grid = self.config.new_board()  # one bit per spot for each color
         self.winning_pos = []   # used to show the winning line
-        for i in range(self.grid_count):
-            self.grid.append(list("." * self.grid_count))
+        # the MCTS player runs in another process, its replies come back as AI_EVENTs
+        self.ai = BackgroundSearch(self.post)
+        self.request = None  # the number of the search we are waiting for, None if we are not
+        self.progress = None  # the last progress reply of that search
+        # what is on the screen, so that draw() only draws the changes: the cached background, whether
+        # everything has to be drawn again, how many pieces are drawn, the search's mark and the winning line
+        self.background = None
+        self.redraw = True
+        self.drawn = 0
+        self.mark = None
+        self.line_drawn = False
 
     # handles the player's clicking
     def handle_key_event(self, e):
@@ -28,7 +46,8 @@ class Board:
         pos = e.pos
         # Check the coordinates are in valid range
         if origin_x <= pos[0] <= origin_x + size and origin_y <= pos[1] <= origin_y + size:
-            if not self.game_over:
+            # the board cannot change under a search that is still running
+            if not self.game_over and self.request is None:
                 x = pos[0] - origin_x
                 y = pos[1] - origin_y
                 r = int(y // self.grid_size)
@@ -42,8 +61,7 @@ class Board:
     # '.' means an empty spot that is available to set the piece
     def set_piece(self, r, c):
         # if the grid is empty, fill it with the color of the current player
-        if self.grid[r][c] == '.':
-            self.grid[r][c] = self.piece
+        if self.grid.set_piece(r, c, self.piece):
             # switch the current player
             if self.piece == 'b':
                 self.piece = 'w'
@@ -55,6 +73,9 @@ class Board:
     # the ai counterpart of handel key event
     # two automatic players against each other
     def autoplay(self):
+        # still waiting for the MCTS player's last move
+        if self.request is not None:
+            return
         # the player 1 is a random player
         if not self.game_over:
             # create a random player
@@ -68,18 +89,43 @@ class Board:
         # the player 2 is a MCTS player
         if not self.game_over:
             # TODO: Modify player2 to use MCTS instead of Randplay
-            # create a MCTS player
-            player2 = MCTS(copy.deepcopy(self.grid), self.piece)
-            # generate the coordinates to put the piece
-            r, c = player2.uct_search()
-            # player2 = Randplay(self.grid, self.piece)
-            # # generate the coordinates to put the piece
-            # r, c = player1.make_move()
+            # ask the background MCTS player for a move. the worker keeps its tree from the last turn,
+            # and the move is played by ai_event when it arrives
+            self.request = self.ai.search(self.grid, self.piece)
+
+    # post a reply of the background search as a pygame event. called from the search's listener thread
+    def post(self, message):
+        pygame.event.post(pygame.event.Event(AI_EVENT, message))
+
+    # handle a reply of the background search: progress is kept for drawing, the move is played
+    def ai_event(self, message):
+        # replies of a search that was cancelled or belongs to an old game
+        if message['request'] != self.request:
+            return
+        if message['kind'] == 'progress':
+            self.progress = message
+            return
+        self.request = None
+        self.progress = None
+        if message['kind'] == 'move' and message['move'] is not None:
+            r, c = message['move']
+            print("MCTS rollouts per second:", int(message['rate']), "reused visits:", message['reused'])
             print("Auto", self.piece, "move: (", r, ",", c, ")")
             # actually put the piece on the board
             self.set_piece(r, c)
             self.check_win(r, c)
 
+    # stop waiting for the MCTS player. the board stays as it is
+    def cancel(self):
+        if self.request is not None:
+            self.ai.cancel()
+            self.request = None
+            self.progress = None
+
+    # stop the background search for good
+    def close(self):
+        self.ai.close()
+
     # Human vs computer
     def semi_autoplay(self):
         if not self.game_over:
@@ -93,107 +139,117 @@ class Board:
             self.set_piece(r, c)
             self.check_win(r, c)
 
-    # checks if five pieces have formed
+    # checks if the winning number of pieces have formed a line
     def check_win(self, r, c):
-        # there are eight direction to check, (row, column)
-        # north direction (up)
-        n_count = self.get_continuous_count(r, c, -1, 0)
-        # south direction (down)
-        s_count = self.get_continuous_count(r, c, 1, 0)
-        # east direction (right)
-        e_count = self.get_continuous_count(r, c, 0, 1)
-        # west direction (left)
-        w_count = self.get_continuous_count(r, c, 0, -1)
-        # south_east diagonal (down right)
-        se_count = self.get_continuous_count(r, c, 1, 1)
-        # north_west diagonal (up left)
-        nw_count = self.get_continuous_count(r, c, -1, -1)
-        # north_east diagonal (up right)
-        ne_count = self.get_continuous_count(r, c, -1, 1)
-        # south_west diagonal (down left)
-        sw_count = self.get_continuous_count(r, c, 1, -1)
-        if (n_count + s_count + 1 >= 5) or (e_count + w_count + 1 >= 5) or \
-                (se_count + nw_count + 1 >= 5) or (ne_count + sw_count + 1 >= 5):
-            self.winner = self.grid[r][c]
+        # the board's win detector gives the ends of the winning line, if there is one
+        line = self.grid.winning_line(r, c)
+        if line is not None:
+            self.winner = self.grid.get(r, c)
             self.game_over = True
-        # store the winning line of five pieces
-        if self.game_over:
-            if n_count + s_count + 1 >= 5:
-                # append start piece
-                self.winning_pos.append((r - n_count, c))
-                # append end piece
-                self.winning_pos.append((r + s_count, c))
-            elif e_count + w_count + 1 >= 5:
-                # append start piece
-                self.winning_pos.append((r, c - w_count))
-                # append end piece
-                self.winning_pos.append((r, c + e_count))
-            elif se_count + nw_count + 1 >= 5:
-                # append start piece
-                self.winning_pos.append((r - nw_count, c - nw_count))
-                # append end piece
-                self.winning_pos.append((r + se_count, c + se_count))
-            elif ne_count + sw_count + 1 >= 5:
-                # append start piece
-                self.winning_pos.append((r + sw_count, c - sw_count))
-                # append end piece
-                self.winning_pos.append((r - ne_count, c + ne_count))
-
-    # count the number of the pieces of the same color as the current piece in a certain direction
-    def get_continuous_count(self, r, c, dr, dc):
-        piece = self.grid[r][c]
-        result = 0
-        i = 1
-        while True:
-            new_r = r + dr * i
-            new_c = c + dc * i
-            if 0 <= new_r < self.grid_count and 0 <= new_c < self.grid_count:
-                if self.grid[new_r][new_c] == piece:
-                    result += 1
-                else:
-                    break
-            else:
-                break
-            i += 1
-        return result
+            # store the ends of the winning line
+            self.winning_pos.append(line[0])
+            self.winning_pos.append(line[1])
 
     # reset the game
     def restart(self):
-        for r in range(self.grid_count):
-            for c in range(self.grid_count):
-                self.grid[r][c] = '.'
+        self.grid.clear()
         self.piece = 'b'
         self.winner = None
         self.game_over = False
         self.winning_pos = []
+        self.request = None
+        self.progress = None
+        self.ai.reset()
+        self.redraw = True
 
-    # draw the graphics
-    def draw(self, screen):
-        pygame.draw.rect(screen, (185, 122, 87),
-                         [self.start_x - self.edge_size, self.start_y - self.edge_size,
-                          (self.grid_count - 1) * self.grid_size + self.edge_size * 2, (self.grid_count - 1) * self.grid_size + self.edge_size * 2], 0)
+    # the board's area on the screen
+    def board_rect(self):
+        size = (self.grid_count - 1) * self.grid_size + self.edge_size * 2
+        return pygame.Rect(self.start_x - self.edge_size, self.start_y - self.edge_size, size, size)
+
+    # the wooden board with its lines, drawn once into a surface of its own
+    def draw_background(self):
+        rect = self.board_rect()
+        background = pygame.Surface(rect.size)
+        background.fill((185, 122, 87))
+        # the surface starts at the board's corner instead of the screen's
+        start_x, start_y = self.start_x - rect.x, self.start_y - rect.y
         # draw horizontal line
         for r in range(self.grid_count):
-            y = self.start_y + r * self.grid_size 
-            pygame.draw.line(screen, (0, 0, 0), [self.start_x, y], [self.start_x + self.grid_size * (self.grid_count - 1), y], 2)
+            y = start_y + r * self.grid_size
+            pygame.draw.line(background, (0, 0, 0), [start_x, y], [start_x + self.grid_size * (self.grid_count - 1), y], 2)
         # draw vertical line
         for c in range(self.grid_count):
-            x = self.start_x + c * self.grid_size 
-            pygame.draw.line(screen, (0, 0, 0), [x, self.start_y], [x, self.start_y + self.grid_size * (self.grid_count - 1)], 2)
+            x = start_x + c * self.grid_size
+            pygame.draw.line(background, (0, 0, 0), [x, start_y], [x, start_y + self.grid_size * (self.grid_count - 1)], 2)
+        return background
+
+    # the square of the screen covered by a piece on (r, c)
+    def cell_rect(self, r, c):
+        half = self.grid_size // 2 + 1
+        return pygame.Rect(self.start_x + c * self.grid_size - half, self.start_y + r * self.grid_size - half,
+                           2 * half + 1, 2 * half + 1)
+
+    # draw the piece on (r, c), if there is one
+    def draw_piece(self, screen, r, c):
+        piece = self.grid.get(r, c)
+        if piece != '.':
+            if piece == 'b':
+                color = (0, 0, 0)
+            else:
+                color = (255, 255, 255)
+            x = self.start_x + c * self.grid_size
+            y = self.start_y + r * self.grid_size
+            pygame.draw.circle(screen, color, [x, y], self.grid_size // 2)
+
+    # draw the square of (r, c) again from the background and the pieces that reach into it. returns the square
+    def draw_cell(self, screen, r, c):
+        rect = self.cell_rect(r, c)
+        screen.set_clip(rect)
+        screen.blit(self.background, self.board_rect())
+        for dr, dc in ((0, 0), (-1, 0), (1, 0), (0, -1), (0, 1)):
+            if 0 <= r + dr < self.grid_count and 0 <= c + dc < self.grid_count:
+                self.draw_piece(screen, r + dr, c + dc)
+        screen.set_clip(None)
+        return rect
+
+    # draw the graphics. only what changed since the last call is drawn: the whole board after a restart,
+    # otherwise the new pieces, the search's mark and the winning line
+    # returns the rectangles of the screen that were drawn on, for pygame.display.update
+    def draw(self, screen):
+        dirty = []
+        if self.background is None:
+            self.background = self.draw_background()
+        if self.redraw:
+            screen.blit(self.background, self.board_rect())
+            for i in self.grid.moves:
+                self.draw_piece(screen, *self.grid.coords(i))
+            self.drawn = len(self.grid.moves)
+            self.mark = None
+            self.line_drawn = False
+            self.redraw = False
+            dirty.append(self.board_rect())
         # draw pieces
-        for r in range(self.grid_count):
-            for c in range(self.grid_count):
-                piece = self.grid[r][c]
-                if piece != '.':
-                    if piece == 'b':
-                        color = (0, 0, 0)
-                    else:
-                        color = (255, 255, 255)
-                    x = self.start_x + c * self.grid_size
-                    y = self.start_y + r * self.grid_size
-                    pygame.draw.circle(screen, color, [x, y], self.grid_size // 2)
-        # draw the winning line of five pieces
-        if self.game_over:
+        for i in self.grid.moves[self.drawn:]:
+            dirty.append(self.draw_cell(screen, *self.grid.coords(i)))
+        self.drawn = len(self.grid.moves)
+        # mark the move the running search would make now
+        mark = None
+        if self.progress is not None and self.progress['move'] is not None:
+            mark = tuple(self.progress['move'])
+        if mark != self.mark:
+            if self.mark is not None:
+                dirty.append(self.draw_cell(screen, *self.mark))
+            if mark is not None:
+                r, c = mark
+                pygame.draw.circle(screen, (200, 30, 30), [self.start_x + c * self.grid_size, self.start_y + r * self.grid_size],
+                                   self.grid_size // 2, 2)
+                dirty.append(self.cell_rect(r, c))
+            self.mark = mark
+        # draw the winning line
+        if self.game_over and not self.line_drawn:
             start_pos = [self.start_x + self.winning_pos[0][1]*self.grid_size, self.start_y + self.winning_pos[0][0]*self.grid_size]
             end_pos = [self.start_x + self.winning_pos[1][1]*self.grid_size, self.start_y + self.winning_pos[1][0]*self.grid_size]
-            pygame.draw.line(screen, (140, 40, 0), start_pos, end_pos, 6)
+            dirty.append(pygame.draw.line(screen, (140, 40, 0), start_pos, end_pos, 6))
+            self.line_drawn = True
+        return dirty
@@ -0,0 +1,194 @@
+from __future__ import absolute_import, division, print_function
+import argparse
+import mmap
+import os
+import random
+import struct
+import sys
+import time
+from symmetry import default_symmetries
+
+MAGIC = b'GMKBOOK1'
+# magic, board size, winning length, number of slots, clock (see Book.clock)
+HEADER = struct.Struct('<8sHHII')
+# key, move (r * size + c of the canonical position), searched iterations, value of the move, last use
+SLOT = struct.Struct('<QHIfI')
+# a key is looked for in this many slots from its home slot
+PROBES = 8
+# a slot whose key is 0 is free, see slot_key
+EMPTY = 0
+# the iterations a stored search needs before its move is played without searching
+MIN_VISITS = 200
+
+
+# an opening book and cache of search results that survives the process: for a position, the move a
+# search chose, the number of iterations behind it and the move's value (win / encounter)
+# positions are looked up by their canonical key (see symmetry.py), so a result also answers the 7 other
+# orientations of its position, and a stored move is turned back to the orientation of the board asked about
+# the file is a fixed size hash table of SLOT records after a HEADER, used through mmap, so opening it
+# reads nothing and a lookup touches a few slots. a key lives in one of the PROBES slots from key % slots.
+# when they are all taken, the one used least recently gives way (the clock counts lookups and stores),
+# so the book never grows, and the positions that keep coming back (the openings) stay
+# one process should write to a file at a time
+class Book:
+    # open an existing book. read_only opens it without the right to store
+    def __init__(self, path, read_only=False, min_visits=MIN_VISITS):
+        self.path = path
+        self.read_only = read_only
+        self.min_visits = min_visits
+        self.file = open(path, 'rb' if read_only else 'r+b')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ if read_only else mmap.ACCESS_WRITE)
+        magic, self.size, self.length, self.slots, self.clock = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC:
+            raise ValueError("{0} is not a book file".format(path))
+        self.symmetries = default_symmetries(self.size)
+        self.hits = 0
+        self.misses = 0
+
+    # create an empty book of slots slots for boards of the given size and winning length, and open it
+    @classmethod
+    def create(cls, path, slots=1 << 16, size=11, length=5, min_visits=MIN_VISITS):
+        with open(path, 'wb') as stream:
+            stream.write(HEADER.pack(MAGIC, size, length, slots, 0))
+            stream.truncate(HEADER.size + slots * SLOT.size)
+        return cls(path, min_visits=min_visits)
+
+    # the key of board with player to move as stored in a slot, and the symmetry that makes it canonical
+    # the canonical key of the empty board is 0, so the keys are moved off 0, which marks a free slot
+    def slot_key(self, board, player):
+        key, t = self.symmetries.canonical(board, player)
+        return key % 0xffffffffffffffff + 1, t
+
+    # the slot where key is, or the slot it should go to, as (slot, found)
+    def find(self, key):
+        home = key % self.slots
+        oldest, oldest_used = None, None
+        for probe in range(PROBES):
+            slot = (home + probe) % self.slots
+            stored, _, _, _, used = SLOT.unpack_from(self.map, HEADER.size + slot * SLOT.size)
+            if stored == key:
+                return slot, True
+            if stored == EMPTY:
+                return slot, False
+            if oldest is None or used < oldest_used:
+                oldest, oldest_used = slot, used
+        return oldest, False
+
+    def tick(self):
+        self.clock += 1
+        if not self.read_only:
+            struct.pack_into('<I', self.map, HEADER.size - 4, self.clock)
+        return self.clock
+
+    # the stored result for player to move on board as (move, visits, value), with the move in the board's
+    # orientation, or None if the position is not in the book
+    def lookup(self, board, player):
+        if (board.size, board.length) != (self.size, self.length):
+            return None
+        key, t = self.slot_key(board, player)
+        slot, found = self.find(key)
+        if not found:
+            self.misses += 1
+            return None
+        self.hits += 1
+        offset = HEADER.size + slot * SLOT.size
+        stored, move, visits, value, used = SLOT.unpack_from(self.map, offset)
+        if not self.read_only:
+            SLOT.pack_into(self.map, offset, stored, move, visits, value, self.tick())
+        r, c = self.symmetries.invert(t, *divmod(move, self.size))
+        return (r, c), visits, value
+
+    # the move to play without searching, or None if the book does not know one with enough iterations
+    def move(self, board, player):
+        entry = self.lookup(board, player)
+        if entry is None or entry[1] < self.min_visits:
+            return None
+        return list(entry[0])
+
+    # store the result of a search: the move (r, c) chosen for player on board after visits iterations,
+    # and its value. a result with fewer iterations than the stored one is dropped
+    def store(self, board, player, move, visits, value):
+        if self.read_only or (board.size, board.length) != (self.size, self.length):
+            return
+        key, t = self.slot_key(board, player)
+        slot, found = self.find(key)
+        offset = HEADER.size + slot * SLOT.size
+        if found and SLOT.unpack_from(self.map, offset)[2] > visits:
+            return
+        r, c = self.symmetries.apply(t, move[0], move[1])
+        SLOT.pack_into(self.map, offset, key, r * self.size + c, visits, value, self.tick())
+
+    # number of positions in the book
+    def entries(self):
+        return sum(1 for slot in range(self.slots)
+                   if SLOT.unpack_from(self.map, HEADER.size + slot * SLOT.size)[0] != EMPTY)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {'slots': self.slots, 'entries': self.entries(), 'hits': self.hits, 'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'bytes': HEADER.size + self.slots * SLOT.size}
+
+    # write the changes out and close the file
+    def close(self):
+        if not self.read_only:
+            self.map.flush()
+        self.map.close()
+        self.file.close()
+
+
+# play games of self-play with MCTS and store the result of every search of their first plies moves
+# a position the book already knows gets the book move, and with probability explore a random move is
+# played instead of the chosen one, so that the games spread over different openings
+# seed makes the games reproducible, output gets one line per game
+def build(book, games, plies, budget, explore=0.25, seed=None, output=sys.stderr):
+    from config import GameConfig
+    from mcts import MCTS
+    rng = random.Random(seed)
+    for game in range(games):
+        random.seed(rng.getrandbits(32))
+        board = GameConfig(book.size, book.length).new_board()
+        piece = 'b'
+        searched = 0
+        started = time.time()
+        while len(board.moves) < plies and board.get_options():
+            search = MCTS(board, piece, budget=budget, book=book)
+            move = search.uct_search()
+            if search.root is not None:
+                searched += 1
+            if rng.random() < explore:
+                move = rng.choice(board.get_options())
+            board.set_piece(move[0], move[1], piece)
+            if board.check_win(move[0], move[1]):
+                break
+            piece = 'w' if piece == 'b' else 'b'
+        output.write("game {0}: {1} positions searched in {2:.1f}s\n".format(game + 1, searched, time.time() - started))
+    return book
+
+
+# command line tool, e.g.
+#   python book.py build book.bin --games 50 --plies 8 --budget 3200
+#   python book.py stats book.bin
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Build or inspect an opening book.")
+    parser.add_argument('command', choices=('build', 'stats'))
+    parser.add_argument('path')
+    parser.add_argument('--games', type=int, default=20, help="self-play games")
+    parser.add_argument('--plies', type=int, default=8, help="moves of each game that go into the book")
+    parser.add_argument('--budget', type=int, default=3200, help="MCTS iterations per position")
+    parser.add_argument('--explore', type=float, default=0.25, help="chance of a random move instead of the book's")
+    parser.add_argument('--slots', type=int, default=1 << 16, help="size of a new book, in positions")
+    parser.add_argument('--size', type=int, default=11, help="board size of a new book")
+    parser.add_argument('--length', type=int, default=5, help="winning length of a new book")
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+    if args.command == 'build':
+        if os.path.exists(args.path):
+            book = Book(args.path, min_visits=args.budget)
+        else:
+            book = Book.create(args.path, args.slots, args.size, args.length, min_visits=args.budget)
+        build(book, args.games, args.plies, args.budget, args.explore, args.seed)
+    else:
+        book = Book(args.path, read_only=True)
+    print(book.stats())
+    book.close()
@@ -0,0 +1,44 @@
+from __future__ import absolute_import, division, print_function
+from bitboard import BitBoard
+
+
+# the rules of a game: the number of lines each way on the board and how many pieces in a row win
+# everything else follows from the board. a BitBoard made by new_board() carries both numbers (as size and
+# length), and State, MCTS, Randplay and the rollout engines read them from the board they are given,
+# so one config decides the whole game
+class GameConfig:
+    # config constructor. length is the winning run, 5 for Gomoku
+    def __init__(self, size=11, length=5):
+        if not 1 < length <= size:
+            raise ValueError("a winning run of {0} does not fit on a {1}x{1} board".format(length, size))
+        self.size = size
+        self.length = length
+        # the largest row or column index
+        self.maxrc = size - 1
+
+    # an empty board for this game. movegen optionally replaces the default move generator
+    def new_board(self, movegen=None):
+        return BitBoard(self.size, movegen, self.length)
+
+    def __eq__(self, other):
+        return isinstance(other, GameConfig) and (self.size, self.length) == (other.size, other.length)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((self.size, self.length))
+
+    def __repr__(self):
+        return "GameConfig(size={0}, length={1})".format(self.size, self.length)
+
+
+# the config of the game a board is being played with
+def board_config(board):
+    return GameConfig(board.size, board.length)
+
+
+# the usual boards: the original 11x11, the 15x15 of standard Gomoku and the 19x19 Go board
+SMALL = GameConfig(11)
+STANDARD = GameConfig(15)
+GO = GameConfig(19)
@@ -0,0 +1,324 @@
+from __future__ import absolute_import, division, print_function
+import argparse
+import json
+import mmap
+import os
+import struct
+from config import GameConfig
+
+# the format and its version, to change whenever the layout of the file does
+MAGIC = b'GMKREC02'
+# magic, board size, winning length, bytes per move
+HEADER = struct.Struct('<8sBBB')
+# the header of a game: winner (see WINNERS) and number of moves, followed by the moves
+GAME = struct.Struct('<BH')
+# the winner codes, 0 for a draw
+WINNERS = {'d': 0, 'b': 1, 'w': 2}
+COLORS = dict((code, color) for color, code in WINNERS.items())
+# an index entry: the offset of a game in the record file
+OFFSET = struct.Struct('<Q')
+# games read at once by the streaming reader
+CHUNK = 1 << 16
+
+
+# the bytes a move takes on a board of the given size: r * size + c in one byte up to 16x16, else two
+def move_bytes(size):
+    return 1 if size * size <= 256 else 2
+
+
+# pack the moves of a game, as (row, column) pairs, into bytes
+def encode(moves, size):
+    codes = [r * size + c for r, c in moves]
+    if move_bytes(size) == 1:
+        return bytes(bytearray(codes))
+    return struct.pack('<{0}H'.format(len(codes)), *codes)
+
+
+# and the other way
+def decode(data, size):
+    if move_bytes(size) == 1:
+        codes = bytearray(data)
+    else:
+        codes = struct.unpack('<{0}H'.format(len(data) // 2), data)
+    return [divmod(code, size) for code in codes]
+
+
+# writes games to a record file: a HEADER, then every game as a GAME header and its moves, one byte each
+# on boards up to 16x16, so a game of 40 moves takes 43 bytes. the offsets of the games go to an index file
+# next to it (path + '.idx', OFFSET each), so that RecordFile can find any game without reading the others
+# a file can be written again later to add games (append), as long as the rules are the same
+class RecordWriter:
+    # writer constructor. the size and length of an existing file win over the arguments when appending
+    def __init__(self, path, size=11, length=5, append=False):
+        self.path = path
+        if append and os.path.exists(path):
+            self.size, self.length = read_header(path)
+            self.stream = open(path, 'ab')
+            if not index_current(path):
+                # e.g. a writer was killed between the game and its offset
+                build_index(path)
+            self.index = open(index_path(path), 'ab')
+        else:
+            self.size, self.length = size, length
+            self.stream = open(path, 'wb')
+            self.stream.write(HEADER.pack(MAGIC, size, length, move_bytes(size)))
+            self.index = open(index_path(path), 'wb')
+        self.offset = self.stream.tell()
+
+    # add a game: its moves as (row, column) pairs, black first, and its winner ('b', 'w' or 'd')
+    def write(self, moves, winner):
+        data = GAME.pack(WINNERS[winner], len(moves)) + encode(moves, self.size)
+        self.stream.write(data)
+        self.index.write(OFFSET.pack(self.offset))
+        self.offset += len(data)
+
+    def close(self):
+        self.stream.close()
+        self.index.close()
+
+
+def index_path(path):
+    return path + '.idx'
+
+
+# raise ValueError if magic, read from the start of path, is not that of this version of the format
+def check_magic(magic, path):
+    if magic[:6] == MAGIC[:6] and magic != MAGIC:
+        raise ValueError("{0} is a game record file of another version ({1}, this is {2})".format(
+            path, magic.decode('ascii', 'replace'), MAGIC.decode('ascii')))
+    if magic != MAGIC:
+        raise ValueError("{0} is not a game record file".format(path))
+
+
+# the size and winning length of a record file
+def read_header(path):
+    with open(path, 'rb') as stream:
+        magic, size, length, width = HEADER.unpack(stream.read(HEADER.size))
+    check_magic(magic, path)
+    return size, length
+
+
+# stream the games of a record file as (moves, winner), the moves as (row, column) pairs
+# the file is read CHUNK bytes at a time, so it never has to fit in memory
+def read_games(path):
+    with open(path, 'rb') as stream:
+        magic, size, length, width = HEADER.unpack(stream.read(HEADER.size))
+        check_magic(magic, path)
+        buffer = b''
+        position = 0
+        while True:
+            if len(buffer) - position < GAME.size:
+                buffer = buffer[position:] + stream.read(CHUNK)
+                position = 0
+                if len(buffer) < GAME.size:
+                    if buffer:
+                        raise ValueError("{0} ends in the middle of a game".format(path))
+                    return
+            winner, plies = GAME.unpack_from(buffer, position)
+            end = position + GAME.size + plies * width
+            while len(buffer) < end:
+                more = stream.read(CHUNK)
+                if not more:
+                    raise ValueError("{0} ends in the middle of a game".format(path))
+                buffer = buffer[position:] + more
+                end -= position
+                position = 0
+            yield decode(buffer[position + GAME.size:end], size), COLORS[winner]
+            position = end
+
+
+# True if the index file of a record file exists and its last offset is that of the last game
+def index_current(path):
+    if not os.path.exists(index_path(path)):
+        return False
+    entries = os.path.getsize(index_path(path)) // OFFSET.size
+    end = os.path.getsize(path)
+    if not entries:
+        return end == HEADER.size
+    with open(index_path(path), 'rb') as index, open(path, 'rb') as stream:
+        index.seek((entries - 1) * OFFSET.size)
+        offset = OFFSET.unpack(index.read(OFFSET.size))[0]
+        stream.seek(offset)
+        header = stream.read(GAME.size)
+        if len(header) < GAME.size:
+            return False
+        winner, plies = GAME.unpack(header)
+        return offset + GAME.size + plies * move_bytes(read_header(path)[0]) == end
+
+
+# write the index file of a record file from its games
+def build_index(path):
+    width = move_bytes(read_header(path)[0])
+    offset = HEADER.size
+    with open(index_path(path), 'wb') as index:
+        for moves, winner in read_games(path):
+            index.write(OFFSET.pack(offset))
+            offset += GAME.size + len(moves) * width
+
+
+# replay the games of a record file through the engine: for every move, yields (board, piece, move, winner)
+# with the position before the move, the color making it and the winner of the game. the board is the same
+# object all through a game and changes after the yield, copy it to keep it
+# a move onto a taken spot, or past the end of the game, raises ValueError
+def replay(path):
+    config = GameConfig(*read_header(path))
+    for moves, winner in read_games(path):
+        board = config.new_board()
+        piece = 'b'
+        for number, (r, c) in enumerate(moves):
+            if (board.occupied >> board.index(r, c)) & 1:
+                raise ValueError("move {0} of a game in {1} is on a taken spot".format(number + 1, path))
+            yield board, piece, (r, c), winner
+            board.set_piece(r, c, piece)
+            if board.check_win(r, c) and number != len(moves) - 1:
+                raise ValueError("a game in {0} goes on after it was won".format(path))
+            piece = 'w' if piece == 'b' else 'b'
+
+
+# any game of a record file by its number, through the index and mmap: a lookup reads one index entry
+# and one game, whatever the size of the file. the index is written again if it is missing or behind
+class RecordFile:
+    def __init__(self, path):
+        self.path = path
+        self.size, self.length = read_header(path)
+        self.width = move_bytes(self.size)
+        if not index_current(path):
+            build_index(path)
+        self.file = open(path, 'rb')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.index_file = open(index_path(path), 'rb')
+        # an empty file cannot be mapped
+        self.index = (mmap.mmap(self.index_file.fileno(), 0, access=mmap.ACCESS_READ)
+                      if os.path.getsize(index_path(path)) else b'')
+
+    def __len__(self):
+        return len(self.index) // OFFSET.size
+
+    # the game number index as (moves, winner)
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("game {0} of {1}".format(index, len(self)))
+        offset = OFFSET.unpack_from(self.index, index * OFFSET.size)[0]
+        winner, plies = GAME.unpack_from(self.map, offset)
+        start = offset + GAME.size
+        return decode(self.map[start:start + plies * self.width], self.size), COLORS[winner]
+
+    def close(self):
+        if self.index:
+            self.index.close()
+        self.index_file.close()
+        self.map.close()
+        self.file.close()
+
+
+# how many games were won by each color and how long they were
+def summary(path):
+    size, length = read_header(path)
+    games, plies = 0, 0
+    winners = {'b': 0, 'w': 0, 'd': 0}
+    for moves, winner in read_games(path):
+        games += 1
+        plies += len(moves)
+        winners[winner] += 1
+    return {'size': size, 'length': length, 'games': games, 'winners': winners,
+            'mean_plies': plies / games if games else 0.0, 'bytes': os.path.getsize(path)}
+
+
+# how often each spot was played, as a size x size list of lists. player only counts the moves of one color,
+# plies only the first moves of every game
+def heatmap(path, player=None, plies=None):
+    size = read_header(path)[0]
+    counts = [[0] * size for _ in range(size)]
+    for moves, winner in read_games(path):
+        first = 0 if player in (None, 'b') else 1
+        step = 1 if player is None else 2
+        for r, c in moves[first:plies:step]:
+            counts[r][c] += 1
+    return counts
+
+
+# the results of the games through every position of their first plies moves. a position and its rotations
+# and mirror images count as one (see symmetry.py). returns {canonical key: {'moves', 'games', 'b', 'w', 'd'}},
+# 'moves' leading to the position in the first game that reached it, and 'b' the games black won from there
+def win_rates(path, plies=4):
+    from symmetry import default_symmetries
+    size, length = read_header(path)
+    symmetries = default_symmetries(size)
+    config = GameConfig(size, length)
+    positions = {}
+    for moves, winner in read_games(path):
+        board = config.new_board()
+        piece = 'b'
+        for number, (r, c) in enumerate(moves[:plies]):
+            board.set_piece(r, c, piece)
+            piece = 'w' if piece == 'b' else 'b'
+            key = symmetries.canonical(board, piece)[0]
+            entry = positions.get(key)
+            if entry is None:
+                entry = positions[key] = {'moves': moves[:number + 1], 'games': 0, 'b': 0, 'w': 0, 'd': 0}
+            entry['games'] += 1
+            entry[winner] += 1
+    return positions
+
+
+# write the games of tournament JSON lines (see tournament.py) to a record file. returns the number of games
+def convert(lines, path):
+    writer = None
+    count = 0
+    for line in lines:
+        result = json.loads(line)
+        if result.get('type') != 'game':
+            continue
+        if writer is None:
+            writer = RecordWriter(path, result.get('size', 11), result.get('length', 5))
+        writer.write([tuple(move) for move in result['moves']], result['winner'])
+        count += 1
+    if writer is not None:
+        writer.close()
+    return count
+
+
+# command line tool, e.g.
+#   python gamerecord.py convert games.jsonl games.gmr
+#   python gamerecord.py stats games.gmr
+#   python gamerecord.py heatmap games.gmr --player b --plies 10
+#   python gamerecord.py winrates games.gmr --plies 3 --top 20
+#   python gamerecord.py show games.gmr --game 41
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Convert, inspect and analyse game record files.")
+    parser.add_argument('command', choices=('convert', 'stats', 'heatmap', 'winrates', 'show'))
+    parser.add_argument('path', help="record file (for convert: the tournament JSON lines)")
+    parser.add_argument('output', nargs='?', help="record file to write (convert)")
+    parser.add_argument('--player', choices=('b', 'w'), default=None, help="only count this color's moves")
+    parser.add_argument('--plies', type=int, default=None, help="only look at the first moves of every game")
+    parser.add_argument('--top', type=int, default=20, help="positions to list, the most played first")
+    parser.add_argument('--min-games', type=int, default=1, help="positions played less often are not listed")
+    parser.add_argument('--game', type=int, default=0, help="the game to show")
+    args = parser.parse_args()
+    if args.command == 'convert':
+        if not args.output:
+            parser.error("convert needs an output file")
+        with open(args.path) as stream:
+            print("{0} games written".format(convert(stream, args.output)))
+    elif args.command == 'stats':
+        print(json.dumps(summary(args.path)))
+    elif args.command == 'heatmap':
+        counts = heatmap(args.path, args.player, args.plies)
+        for row in counts:
+            print(' '.join("{0:5}".format(count) for count in row))
+    elif args.command == 'winrates':
+        positions = win_rates(args.path, args.plies or 4)
+        ranked = sorted((entry for entry in positions.values() if entry['games'] >= args.min_games),
+                        key=lambda entry: -entry['games'])
+        for entry in ranked[:args.top]:
+            print("{0:6} games  black {1:5.1%}  white {2:5.1%}  {3}".format(
+                entry['games'], entry['b'] / entry['games'], entry['w'] / entry['games'],
+                ' '.join("{0},{1}".format(r, c) for r, c in entry['moves'])))
+    else:
+        records = RecordFile(args.path)
+        moves, winner = records[args.game]
+        records.close()
+        print(json.dumps({'game': args.game, 'winner': winner, 'plies': len(moves),
+                          'moves': [list(move) for move in moves]}))
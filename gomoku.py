@@ -1,21 +1,39 @@
 from __future__ import absolute_import, division, print_function
-import pygame
-from pygame.locals import *
-from board import *
+import sys
+from config import GameConfig
+
+# the background search worker is a fresh interpreter that runs this file again, as __mp_main__, before it
+# starts searching. it needs none of the GUI, so pygame is only imported when the file is not run that way
+if __name__ != '__mp_main__':
+    import pygame
+    from pygame.locals import *
+    from board import *
+
+    # the event of a window coming back into view, which pygame 2 sends next to VIDEOEXPOSE
+    WINDOW_EXPOSED = getattr(pygame, 'WINDOWEXPOSED', VIDEOEXPOSE)
+
+
+# the height of the status line at the top of the window, in pixels
+STATUS_HEIGHT = 30
 
 
 class Gomoku:
-    # game constructor
-    def __init__(self):
+    # game constructor. config is the GameConfig of the games to play
+    def __init__(self, config=None):
         pygame.init()
         self.screen = pygame.display.set_mode((530, 550))
         pygame.display.set_caption("Gomoku")
         self.clock = pygame.time.Clock()
         self.font = pygame.font.SysFont("ariel",18)
         self.going = True
-        self.board = Board()
+        self.board = Board(config)
         self.auto = False
         self.semiauto = True
+        # the status line on the screen, drawn again only when it changes
+        self.status = None
+        # mouse moves would wake the loop up for nothing
+        pygame.event.set_blocked(MOUSEMOTION)
+        self.repaint()
 
     # keeps the game going
     def loop(self):
@@ -26,6 +44,7 @@ class Gomoku:
             self.clock.tick(60)
         # game finished if not going
         print("Game finished.")
+        self.board.close()
         pygame.quit()
 
     # where actual moves happen
@@ -35,10 +54,20 @@ class Gomoku:
             # Two automatic players against each other
             # TODO NEED TO IMPLEMENT
             self.board.autoplay()
+        # unless autoplay has a move to make right away, nothing changes until the next event (a click, a key,
+        # a reply of the background search), so sleep until it comes instead of running 60 frames per second
+        if self.auto and self.board.request is None and not self.board.game_over:
+            events = pygame.event.get()
+        else:
+            events = [pygame.event.wait()] + pygame.event.get()
         # read key input
-        for e in pygame.event.get():
+        for e in events:
             if e.type == QUIT:
                 self.going = False
+            if e.type in (VIDEOEXPOSE, WINDOW_EXPOSED):
+                self.repaint()
+            if e.type == AI_EVENT:
+                self.board.ai_event(e.dict)
             if e.type == MOUSEBUTTONDOWN:
                 self.auto = False
                 if self.board.handle_key_event(e):
@@ -52,21 +81,51 @@ class Gomoku:
                     self.board.restart()
                 if e.key == K_m:
                     self.semiauto = not self.semiauto
+                if e.key == K_ESCAPE:
+                    self.auto = False
+                    self.board.cancel()
 
-    # draw the game board graphics
-    def draw(self):
-        self.screen.fill((255, 255, 255))
-        self.board.draw(self.screen)
+    # the text of the status line
+    def status_text(self):
         if self.board.game_over:
-            self.screen.blit(self.font.render("{0} Won. Press Space to restart.".format("Black" if self.board.winner == 'b' else "White"), True, (0, 0, 0)), (10, 8))
+            return "{0} Won. Press Space to restart.".format("Black" if self.board.winner == 'b' else "White")
+        elif self.board.request is not None:
+            progress = self.board.progress
+            if progress is None:
+                return "MCTS thinking. Press Esc to cancel."
+            return "MCTS thinking: {0}/{1} iterations, best move {2}. Press Esc to cancel.".format(
+                progress['iterations'], progress['budget'], progress['move'])
         elif self.auto:
-            self.screen.blit(self.font.render("AI vs AI autoplaying.", True, (0, 0, 0)), (10, 8))                        
+            return "AI vs AI autoplaying."
         elif self.semiauto:
-            self.screen.blit(self.font.render("Click to put down a piece. Press Enter for autoplay. Press 'm' for manual play.".format("Black" if self.board.piece == 'b' else "White"), True, (0, 0, 0)), (10, 8))            
+            return "Click to put down a piece. Press Enter for autoplay. Press 'm' for manual play."
         else:
-            self.screen.blit(self.font.render("Manual Play: {0}'s Turn. Click to put down a piece. Press 'm' to play against AI.".format("Black" if self.board.piece == 'b' else "White"), True, (0, 0, 0)), (10, 8))            
+            return "Manual Play: {0}'s Turn. Click to put down a piece. Press 'm' to play against AI.".format("Black" if self.board.piece == 'b' else "White")
+
+    # draw the whole window again, e.g. when it was covered by another one
+    def repaint(self):
+        self.screen.fill((255, 255, 255))
+        self.board.redraw = True
+        self.status = None
+        self.draw()
         pygame.display.update()
 
+    # draw the game board graphics. only the parts of the window that changed are drawn and sent to the display
+    def draw(self):
+        dirty = self.board.draw(self.screen)
+        text = self.status_text()
+        if text != self.status:
+            self.status = text
+            area = pygame.Rect(0, 0, self.screen.get_width(), STATUS_HEIGHT)
+            self.screen.fill((255, 255, 255), area)
+            self.screen.blit(self.font.render(text, True, (0, 0, 0)), (10, 8))
+            dirty.append(area)
+        if dirty:
+            pygame.display.update(dirty)
+
+# usage: python gomoku.py [board size] [winning length], e.g. python gomoku.py 15
 if __name__ == '__main__':
-    game = Gomoku()
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 11
+    length = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    game = Gomoku(GameConfig(size, length))
     game.loop()
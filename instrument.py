@@ -0,0 +1,163 @@
+from __future__ import absolute_import, division, print_function
+import os
+import time
+
+# the phases of an MCTS iteration, as timed by SearchStats and reported to the hooks
+SELECTION = 'selection'
+EXPANSION = 'expansion'
+SIMULATION = 'simulation'
+BACK_PROPAGATION = 'back_propagation'
+PHASES = (SELECTION, EXPANSION, SIMULATION, BACK_PROPAGATION)
+# the spans that enclose the phases
+ITERATION = 'iteration'
+SEARCH = 'search'
+
+
+# what one search (one move) did, filled in by an MCTS created with stats=SearchStats()
+# the phase times are exclusive: the expansion that happens inside a selection is not counted in
+# the selection's time. with batched rollouts an iteration span covers a whole batch
+# the numbers are reset when the next search starts, so after uct_search() they describe that move
+class SearchStats:
+    # stats constructor
+    def __init__(self):
+        self.reset()
+
+    # forget the last search
+    def reset(self):
+        self.seconds = 0.0
+        self.phase_seconds = dict((phase, 0.0) for phase in PHASES)
+        self.iterations = 0
+        self.expanded = 0
+        self.rollouts = 0
+        self.rollout_moves = 0
+        # the depth of the leaves reached by the selections, the root being at depth 0
+        self.max_depth = 0
+        self.total_depth = 0
+        # filled in by finish()
+        self.nodes = 0
+        self.branching = 0.0
+        self.root_visits = []
+        # the counters of the search's node pool (see nodepool.NodePool.stats), None without one
+        self.memory = None
+
+    # the numbers that need the tree: its size, the average number of children of the nodes that have
+    # some, and the visits and wins of each child of the root as (move, visits, wins), most visited first
+    # the tree is walked once, so this is only called at the end of a search
+    def finish(self, search, root):
+        seen = set()
+        pending = [root]
+        parents, children = 0, 0
+        while pending:
+            node = pending.pop()
+            if id(node) in seen:
+                continue
+            seen.add(id(node))
+            if node.children:
+                parents += 1
+                children += len(node.children)
+                pending.extend(node.children)
+        self.nodes = len(seen)
+        self.branching = children / parents if parents else 0.0
+        self.root_visits = sorted(((tuple(search.child_move(root, child)), child.encounter, child.win)
+                                   for child in root.children), key=lambda entry: -entry[1])
+        self.memory = search.pool.stats() if search.pool is not None else None
+
+    # average moves per random game
+    def rollout_length(self):
+        return self.rollout_moves / self.rollouts if self.rollouts else 0.0
+
+    # average depth of the selected leaves
+    def mean_depth(self):
+        return self.total_depth / self.iterations if self.iterations else 0.0
+
+    # everything as a dict of plain values, e.g. for json.dumps
+    def as_dict(self):
+        return {
+            'seconds': self.seconds,
+            'phase_seconds': dict(self.phase_seconds),
+            'iterations': self.iterations,
+            'expanded': self.expanded,
+            'rollouts': self.rollouts,
+            'rollout_length': self.rollout_length(),
+            'max_depth': self.max_depth,
+            'mean_depth': self.mean_depth(),
+            'nodes': self.nodes,
+            'branching': self.branching,
+            'root_visits': [[list(move), visits, wins] for move, visits, wins in self.root_visits],
+            'memory': self.memory,
+        }
+
+    # a few lines for a person to read
+    def report(self):
+        lines = ["{0} iterations in {1:.3f}s, {2} nodes, branching {3:.1f}, depth {4:.1f} (max {5})".format(
+            self.iterations, self.seconds, self.nodes, self.branching, self.mean_depth(), self.max_depth)]
+        for phase in PHASES:
+            share = self.phase_seconds[phase] / self.seconds if self.seconds else 0.0
+            lines.append("  {0:17} {1:8.3f}s {2:5.1%}".format(phase, self.phase_seconds[phase], share))
+        lines.append("  {0} rollouts of {1:.1f} moves".format(self.rollouts, self.rollout_length()))
+        if self.memory is not None:
+            lines.append("  {peak} nodes at most of {capacity}, {pruned} pruned in {prunes} prunes, "
+                         "{recycled} recycled".format(**self.memory))
+        for move, visits, wins in self.root_visits[:5]:
+            lines.append("  {0}: {1} visits, value {2:+.3f}".format(move, visits, wins / visits if visits else 0.0))
+        return '\n'.join(lines)
+
+
+# a hook that keeps every span it is told about and writes them as a Chrome trace (the JSON format
+# read by chrome://tracing, Perfetto and speedscope), where the nested spans show up as a flame graph
+# a hook is any callable taking (name, started, seconds), with started a time.time() value
+# each search is one 'search' span holding its 'iteration' spans, which hold the phases
+# the spans of every search go to the same trace, one after the other, until write() or clear()
+class TraceRecorder:
+    # recorder constructor. label names the process in the trace viewer
+    def __init__(self, label='mcts'):
+        self.label = label
+        self.events = []
+
+    def __call__(self, name, started, seconds):
+        self.events.append({'name': name, 'ph': 'X', 'ts': started * 1e6, 'dur': seconds * 1e6,
+                            'pid': os.getpid(), 'tid': 0})
+
+    # forget the spans recorded so far
+    def clear(self):
+        del self.events[:]
+
+    # write the spans to a JSON file. json is imported here, MCTS imports this module and seldom writes traces
+    def write(self, path):
+        import json
+        metadata = {'name': 'process_name', 'ph': 'M', 'pid': os.getpid(), 'tid': 0,
+                    'args': {'name': self.label}}
+        with open(path, 'w') as stream:
+            json.dump({'traceEvents': [metadata] + self.events, 'displayTimeUnit': 'ms'}, stream)
+
+
+# a hook that writes one trace file per search, e.g. to look at the slow moves of a game on their own
+# the files are pattern formatted with the number of the search, starting at 1
+class MoveTracer:
+    # tracer constructor. pattern is a path like 'trace-{0:03}.json'
+    def __init__(self, pattern):
+        self.pattern = pattern
+        self.recorder = TraceRecorder()
+        self.moves = 0
+
+    def __call__(self, name, started, seconds):
+        self.recorder(name, started, seconds)
+        if name == SEARCH:
+            self.moves += 1
+            self.recorder.write(self.pattern.format(self.moves))
+            self.recorder.clear()
+
+
+# times a span for the stats and the hooks. used by MCTS only when instrumentation is on
+class Span:
+    def __init__(self, name, hooks):
+        self.name = name
+        self.hooks = hooks
+        self.started = time.time()
+
+    # the span's seconds, after telling the hooks about it
+    def end(self):
+        seconds = time.time() - self.started
+        for hook in self.hooks:
+            hook(self.name, self.started, seconds)
+        return seconds
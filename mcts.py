@@ -1,16 +1,27 @@
 from __future__ import absolute_import, division, print_function
-from math import sqrt, log
-import random
-import numpy as np
-import copy
-
-MAXRC = 10
-GRID_COUNT = 11
-GRID_SIZE = 52
+from math import sqrt, log, ceil
+import time
+from instrument import SearchStats, Span, SELECTION, EXPANSION, SIMULATION, BACK_PROPAGATION, ITERATION, SEARCH
+from symmetry import default_symmetries
+
 BLACK = 0
 WHITE = 1
 DRAW = 0.5
 BUDGET = 1600
+# progressive widening: a node may have at most base * visits ** exponent children, as (base, exponent)
+WIDENING = (2, 0.5)
+# the weight of the prior in the PUCT formula
+PUCT = 3
+# the smallest useful batch (see batch_step): below it, setting up the NumPy games costs more than playing
+# them one at a time (batches of 8 run at about half the speed of the plain search, 32 at the same).
+# smaller batches are raised to it
+MIN_BATCH = 32
+
+
+# the index of the largest value, the first one on a tie, as numpy.argmax but without importing numpy:
+# the engine only needs numpy for batched rollouts, which import it when they are first used
+def argmax(values):
+    return values.index(max(values))
 
 
 # the node class in the simulator tree
@@ -28,27 +39,35 @@ class State:
         self.options = []
         self.rand = False
         self.parent = None
+        # with a prior: the probability the prior gave the move into this node, and the ones of the options
+        # (same order), filled in when the node is first expanded
+        self.prior = 1.0
+        self.option_priors = None
 
     # a constructor that create a child by taking a move from a parent
     def constructor_move(self, parent, move):
-        self.grid = copy.deepcopy(parent.grid)
+        # copying a bitboard only copies two integers and the move list
+        self.grid = parent.grid.copy()
         self.player = parent.player
         self.parent = parent
         self.move = move
         self.set_piece(move[0], move[1])
         self.check_win(move[0], move[1])
+        # the options are kept last first, so that expansion takes the next one off the end of the list
         self.options = self.get_options()
+        self.options.reverse()
 
     # a constructor that initializes the fields with parameters
+    # grid is a BitBoard
     def constructor_params(self, grid, player):
-        self.grid = copy.deepcopy(grid)
+        self.grid = grid.copy()
         self.player = player  # the color of the CURRENT player
         self.options = self.get_options()
+        self.options.reverse()
 
     # helper function. take a pair of coordinates and set
     def set_piece(self, r, c):
-        if self.grid[r][c] == '.':
-            self.grid[r][c] = self.player
+        if self.grid.set_piece(r, c, self.player):
             # as soon as the piece is set, switch the children's role
             if self.player == 'b':
                 self.player = 'w'
@@ -59,189 +78,484 @@ class State:
         return False
 
     # heuristics that only checks the neighbors of existing pieces
-    # if the whole board is
+    # the board returns the empty spots in the bounding box of the pieces grown by one
     def get_options(self):
-        # get options for the random player
-        # if self.rand:
-        # collect all occupied spots
-        current_pcs = []
-        for r in range(GRID_COUNT):
-            for c in range(GRID_COUNT):
-                if not self.grid[r][c] == '.':
-                    current_pcs.append((r, c))
-        # At the beginning of the game, current_pcs is empty
-        if not current_pcs:
-            return [(MAXRC//2, MAXRC//2)]
-        # Reasonable moves should be close to where the current pieces are
-        # Think about what these calculations are doing
-        # Note: min(list, key=lambda x: x[0]) picks the element with the min value on the first dimension
-        min_r = max(0, min(current_pcs, key=lambda x: x[0])[0]-1)
-        max_r = min(MAXRC, max(current_pcs, key=lambda x: x[0])[0]+1)
-        min_c = max(0, min(current_pcs, key=lambda x: x[1])[1]-1)
-        max_c = min(MAXRC, max(current_pcs, key=lambda x: x[1])[1]+1)
-        # Options of reasonable next step moves
-        options = []
-        for i in range(min_r, max_r+1):
-            for j in range(min_c, max_c+1):
-                if self.grid[i][j] == '.':
-                    options.append((i, j))
-        # get options for my AI
-        # else:
-        #     # # get all the positions of the pieces of the AI's color
-        #     current_pcs = []
-        #     # for r in range(GRID_COUNT):
-        #     #     for c in range(GRID_COUNT):
-        #     #         if self.grid[r][c] == self.player:
-        #     #             current_pcs.append((r, c))
-        #
-        #     for r in range(GRID_COUNT):
-        #         for c in range(GRID_COUNT):
-        #             if self.grid[r][c] != '.':
-        #                 current_pcs.append((r, c))
-        #     # At the beginning of the game, current_pcs is empty
-        #     if not current_pcs:
-        #         return [(MAXRC // 2 - 1, MAXRC // 2 - 1)]
-        #     # only explore the positions right next to the pieces of our own color
-        #     options = []
-        #     temp = set()
-        #     for occupied in current_pcs:
-        #         temp.add((occupied[0] - 1, occupied[1] - 1))
-        #         temp.add((occupied[0], occupied[1] - 1))
-        #         temp.add((occupied[0] + 1, occupied[1] - 1))
-        #         temp.add((occupied[0] - 1, occupied[1]))
-        #         temp.add((occupied[0] + 1, occupied[1]))
-        #         temp.add((occupied[0] - 1, occupied[1] + 1))
-        #         temp.add((occupied[0], occupied[1] + 1))
-        #         temp.add((occupied[0] + 1, occupied[1] + 1))
-        #     for potential in list(temp):
-        #         if 0 <= potential[0] < GRID_COUNT and 0 <= potential[1] < GRID_COUNT:
-        #             if self.grid[potential[0]][potential[1]] == '.':
-        #                 options.append(potential)
+        options = self.grid.get_options()
         # In the unlikely event that no one wins before board is filled
         if len(options) == 0:
             self.game_over = True
             self.winner = 'd'
         return options
 
-    # checks if five pieces have formed
+    # checks if the winning number of pieces have formed a line
     # if so set the game over flag and record the winner
     def check_win(self, r, c):
-        # there are eight direction to check, (row, column)
-        # north direction (up)
-        n_count = self.get_continuous_count(r, c, -1, 0)
-        # south direction (down)
-        s_count = self.get_continuous_count(r, c, 1, 0)
-        # east direction (right)
-        e_count = self.get_continuous_count(r, c, 0, 1)
-        # west direction (left)
-        w_count = self.get_continuous_count(r, c, 0, -1)
-        # south_east diagonal (down right)
-        se_count = self.get_continuous_count(r, c, 1, 1)
-        # north_west diagonal (up left)
-        nw_count = self.get_continuous_count(r, c, -1, -1)
-        # north_east diagonal (up right)
-        ne_count = self.get_continuous_count(r, c, -1, 1)
-        # south_west diagonal (down left)
-        sw_count = self.get_continuous_count(r, c, 1, -1)
-        if (n_count + s_count + 1 >= 5) or (e_count + w_count + 1 >= 5) or \
-                (se_count + nw_count + 1 >= 5) or (ne_count + sw_count + 1 >= 5):
-            self.winner = self.grid[r][c]
+        if self.grid.check_win(r, c):
+            self.winner = self.grid.get(r, c)
             self.game_over = True
         return
 
-    # count the number of the pieces of the same color as the current piece in a certain direction
-    def get_continuous_count(self, r, c, dr, dc):
-        piece = self.grid[r][c]
-        result = 0
-        i = 1
-        while True:
-            new_r = r + dr * i
-            new_c = c + dc * i
-            if 0 <= new_r < GRID_COUNT and 0 <= new_c < GRID_COUNT:
-                if self.grid[new_r][new_c] == piece:
-                    result += 1
-                else:
-                    break
-            else:
-                break
-            i += 1
-        return result
-
 
 class MCTS:
     # constructor of a Monte Carlo Tree Search object
-    def __init__(self, grid, player):
+    # grid is a BitBoard. movegen optionally replaces the board's move generator for this search,
+    # e.g. MoveGenerator(radius=2, policy='neighbourhood', order='center')
+    # the search stops after budget iterations or time_limit milliseconds, whichever comes first.
+    # with neither, it runs BUDGET iterations. with only a time limit, the number of iterations is not capped
+    # early_stop ends the search as soon as the chosen move can no longer change, see decided()
+    # table is an optional TranspositionTable. with it, positions reached by different move orders
+    # share one node and its statistics, see expansion()
+    # batch > 1 selects that many leaves at a time and plays their random games together with NumPy,
+    # see batch_step(). a smaller batch is raised to MIN_BATCH. the batched games always use the default
+    # bounding box move rule
+    # stats is an optional instrument.SearchStats that every search fills in with phase timings, tree shape
+    # and the root's visits. hooks are callables told about every timed span, see instrument.py; a search
+    # with hooks and no stats gets its own SearchStats. with neither, the search is not timed at all
+    # policy plays the simulations, e.g. policy.ThreatPolicy(). by default they are random games played by
+    # the board itself. batched games are always random
+    # prior scores the moves, e.g. prior.ThreatPrior(). with it, the options are expanded best first and the
+    # children are selected with PUCT instead of UCB, see best_child(); puct weighs the prior
+    # widening is a (base, exponent) pair such as WIDENING: a node may then only have base * visits ** exponent
+    # children, the next option being expanded once the node has had enough visits (progressive widening)
+    # book is an optional book.Book: uct_search() then plays the book's move without searching when it has
+    # one, and stores the result of every search it runs
+    # symmetry: a node whose position is symmetric (see symmetry.Symmetries) only gets one child for every
+    # set of moves its symmetries map onto each other, so those moves share one set of statistics
+    # pool is an optional nodepool.NodePool, which caps the memory of the tree by pruning it (not with a table)
+    def __init__(self, grid, player, movegen=None, budget=None, time_limit=None, early_stop=False, table=None,
+                 batch=None, stats=None, hooks=None, policy=None, prior=None, widening=None, puct=PUCT, book=None,
+                 symmetry=False, pool=None):
+        if pool is not None and table is not None:
+            raise ValueError("a node pool cannot prune a tree shared through a transposition table")
+        if batch is not None and 1 < batch < MIN_BATCH:
+            batch = MIN_BATCH
+        self.movegen = movegen
+        if movegen is not None:
+            grid = grid.copy(movegen)
         self.initial_board = grid
         self.ai_role = player
         self.cur_role = player
+        self.budget = budget
+        self.time_limit = time_limit
+        self.early_stop = early_stop
+        self.table = table
+        self.batch = batch
+        self.batch_engine = None
+        self.policy = policy
+        self.prior = prior
+        self.widening = widening
+        self.puct = puct
+        self.book = book
+        self.symmetries = default_symmetries(grid.size) if symmetry else None
+        self.pool = pool
+        self.hooks = list(hooks or [])
+        if stats is None and self.hooks:
+            stats = SearchStats()
+        self.stats = stats
+        # the nodes visited by the last selection, from the root down. with a transposition table a node
+        # can have several parents, so the result is propagated along this path instead of the parent links
+        self.path = []
+        # the anytime state: the current root, how many iterations it has had and whether stop() was called
+        self.root = None
+        self.iterations = 0
+        self.stopped = False
+        # visits the root already had when the last search started, thanks to the tree kept from earlier moves
+        self.reused = 0
+        # number of playouts and the seconds spent in them, to report the rollout speed
+        self.rollouts = 0
+        self.rollout_time = 0.0
 
     # high level interface for MCTS. takes a root state and make a decision by calling other functions
     def uct_search(self):
-        # create the root node and get all the possible moves
-        root_state = State()
-        root_state.constructor_params(self.initial_board, self.ai_role)
-        for i in range(0, BUDGET):
+        if self.book is not None:
+            move = self.book.move(self.initial_board, self.ai_role)
+            if move is not None:
+                return move
+        self.build_tree()
+        move = self.best_move()
+        if self.book is not None and move is not None:
+            # the value of the chosen child, as in best_move()
+            child = max(self.root.children, key=lambda child: child.win / child.encounter)
+            self.book.store(self.initial_board, self.ai_role, move, self.root.encounter, child.win / child.encounter)
+        return move
+
+    # runs the search loop until the budget, the time limit or stop() ends it, and returns the root of the tree
+    def build_tree(self):
+        root_state = self.start()
+        if self.stats is not None:
+            self.stats.reset()
+            search = Span(SEARCH, self.hooks)
+        budget = self.budget
+        if budget is None and self.time_limit is None:
+            budget = BUDGET
+        started = time.time()
+        deadline = None
+        if self.time_limit is not None:
+            deadline = started + self.time_limit / 1000.0
+        next_check = 16
+        while not self.stopped:
+            if budget is not None and self.iterations >= budget:
+                break
+            if deadline is not None and time.time() >= deadline:
+                break
+            count = self.batch or 1
+            if budget is not None:
+                count = min(count, budget - self.iterations)
+            self.step(count)
+            # looking at the root's children every iteration would cost more than it saves
+            if self.early_stop and self.iterations >= next_check:
+                next_check = self.iterations + 16
+                # the iterations left, estimated from the speed so far when only the clock limits the search
+                remaining = None
+                if budget is not None:
+                    remaining = budget - self.iterations
+                if deadline is not None:
+                    now = time.time()
+                    estimate = (deadline - now) * self.iterations / max(now - started, 1e-9)
+                    if remaining is None or estimate < remaining:
+                        remaining = estimate
+                if self.decided(remaining):
+                    break
+        if self.stats is not None:
+            self.stats.seconds = search.end()
+            self.stats.finish(self, root_state)
+        return root_state
+
+    # anytime interface: create the root node and get all the possible moves
+    # if update() kept the tree from the previous move, the search carries on from it instead
+    # after this, step() can be called as often as the caller likes, and best_move() at any point
+    def start(self):
+        if self.root is None and self.table is not None:
+            self.root = self.table.get(self.initial_board.key(self.ai_role))
+        if self.root is None:
+            self.root = State()
+            self.root.constructor_params(self.initial_board, self.ai_role)
+            if self.table is not None:
+                self.table.store(self.initial_board.key(self.ai_role), self.root)
+        if self.pool is not None:
+            self.pool.start(self.root)
+        self.reused = self.root.encounter
+        self.iterations = 0
+        self.stopped = False
+        return self.root
+
+    # keep the search object between moves: grid is the new position to search from
+    # if the old root's position leads to it, the root moves down through the moves played since
+    # (usually our own move and the opponent's reply), keeping the statistics of that subtree.
+    # otherwise, or if it is not ai_role's turn there, the next search starts from a fresh root
+    def update(self, grid):
+        if self.movegen is not None:
+            grid = grid.copy(self.movegen)
+        self.initial_board = grid
+        # the last selection path would keep the old tree alive
+        self.path = []
+        if self.root is None:
+            return
+        # the old root's pieces must all still be there (the order they were played in does not matter,
+        # a node shared through the transposition table may have been reached by another order)
+        known = self.root.grid
+        if known.bits['b'] & ~grid.bits['b'] or known.bits['w'] & ~grid.bits['w']:
+            self.root = None
+            return
+        # the pieces added since, by color. they are played from the old root taking turns, its player first,
+        # which reaches the new position whatever order they were set up in. if they cannot be (one color has
+        # too many, or the game ends on the way), the new position does not follow from the old one
+        # a child only matches a move if it holds the mover's piece there, see advance()
+        added = {'b': [], 'w': []}
+        for i in grid.moves:
+            if not (known.occupied >> i) & 1:
+                r, c = grid.coords(i)
+                added[grid.get(r, c)].append((r, c))
+        while added['b'] or added['w']:
+            if self.root.game_over or not added[self.root.player]:
+                self.root = None
+                return
+            self.advance(added[self.root.player].pop(0))
+        # and exactly those pieces, in case grid.moves missed some
+        bits = self.root.grid.bits
+        if bits['b'] != grid.bits['b'] or bits['w'] != grid.bits['w']:
+            self.root = None
+        elif self.root.player != self.ai_role or self.root.game_over:
+            self.root = None
+
+    # move the root down to the child reached by the root's player playing move. the rest of the old tree is
+    # no longer referenced by anything and is freed, so only the subtree that can still be reached is kept
+    def advance(self, move):
+        move = tuple(move)
+        grid = self.root.grid
+        if (grid.occupied >> grid.index(move[0], move[1])) & 1:
+            raise ValueError("{0} is already taken".format(move))
+        for child in self.root.children:
+            if child.grid.get(move[0], move[1]) == self.root.player:
+                break
+        else:
+            # the move was never expanded, start a new subtree for it
+            child = State()
+            child.constructor_move(self.root, move)
+        child.parent = None
+        self.root = child
+
+    # runs count iterations of the search loop on the current root
+    def step(self, count=1):
+        if self.batch and self.batch > 1:
+            self.batch_step(count)
+            return
+        if self.stats is not None:
+            self.timed_step(count)
+            return
+        for i in range(0, count):
             # decide which child should we try next
-            next_try = self.selection(root_state)
+            next_try = self.selection(self.root)
             # simulate a game to the end on the chosen child
             terminal = self.simulation(next_try)
             # update the child with the game result
             self.back_propagation(next_try, terminal)
+            self.iterations += 1
+            self.trim()
+
+    # step() with every phase timed for the stats and the hooks
+    def timed_step(self, count):
+        stats, hooks, seconds = self.stats, self.hooks, self.stats.phase_seconds
+        for i in range(0, count):
+            iteration = Span(ITERATION, hooks)
+            span = Span(SELECTION, hooks)
+            expansion = seconds[EXPANSION]
+            next_try = self.selection(self.root)
+            # the expansion inside the selection was timed on its own
+            seconds[SELECTION] += span.end() - (seconds[EXPANSION] - expansion)
+            stats.total_depth += len(self.path) - 1
+            stats.max_depth = max(stats.max_depth, len(self.path) - 1)
+            span = Span(SIMULATION, hooks)
+            terminal = self.simulation(next_try)
+            seconds[SIMULATION] += span.end()
+            span = Span(BACK_PROPAGATION, hooks)
+            self.back_propagation(next_try, terminal)
+            seconds[BACK_PROPAGATION] += span.end()
+            self.iterations += 1
+            self.trim()
+            stats.iterations += 1
+            iteration.end()
+
+    # batch mode: select up to batch leaves before simulating any of them, play all their games at once
+    # with a BatchRollout and then back every result up along the path its selection took
+    # each selection expands a new child, so the leaves of one batch are different nodes. until its result
+    # is known, a selected path counts as one visit lost for its movers (a virtual loss), which gives the
+    # new children a visit for the UCB formula and steers the next selections of the batch elsewhere
+    def batch_step(self, count):
+        if self.batch_engine is None:
+            from batchrollout import BatchRollout
+            self.batch_engine = BatchRollout(self.initial_board.size, self.initial_board.length)
+        stats, hooks = self.stats, self.hooks
+        done = 0
+        while done < count:
+            if stats is not None:
+                iteration = Span(ITERATION, hooks)
+                span = Span(SELECTION, hooks)
+                expansion = stats.phase_seconds[EXPANSION]
+            leaves, paths = self.select_leaves(min(self.batch, count - done))
+            if stats is not None:
+                stats.phase_seconds[SELECTION] += span.end() - (stats.phase_seconds[EXPANSION] - expansion)
+                stats.total_depth += sum(len(path) - 1 for path in paths)
+                stats.max_depth = max([stats.max_depth] + [len(path) - 1 for path in paths])
+                span = Span(SIMULATION, hooks)
+            playing = [leaf for leaf in leaves if not leaf.game_over]
+            started = time.time()
+            winners = self.batch_engine.play([leaf.grid for leaf in playing],
+                                             [leaf.player for leaf in playing]) if playing else []
+            self.rollout_time += time.time() - started
+            self.rollouts += len(playing)
+            if stats is not None:
+                stats.phase_seconds[SIMULATION] += span.end()
+                if playing:
+                    stats.rollouts += len(playing)
+                    stats.rollout_moves += self.batch_engine.moves
+                span = Span(BACK_PROPAGATION, hooks)
+            self.back_up_leaves(leaves, paths, winners)
+            done += len(leaves)
+            if stats is not None:
+                stats.phase_seconds[BACK_PROPAGATION] += span.end()
+                stats.iterations += len(leaves)
+                iteration.end()
+
+    # the selection half of a batch: select count leaves, each path taking a virtual loss until its result
+    # is backed up. returns (leaves, paths)
+    def select_leaves(self, count):
+        leaves = []
+        paths = []
+        for i in range(0, count):
+            leaves.append(self.selection(self.root))
+            paths.append(self.path)
+            for node in self.path:
+                node.encounter += 1
+                node.win -= 1
+        return leaves, paths
+
+    # the other half: take the virtual losses back and back up the results. winners has the winner of
+    # every leaf whose game was not over yet, in order
+    def back_up_leaves(self, leaves, paths, winners):
+        winners = iter(winners)
+        for leaf, path in zip(leaves, paths):
+            for node in path:
+                node.encounter -= 1
+                node.win += 1
+            self.path = path
+            self.back_propagation(leaf, leaf.winner if leaf.game_over else next(winners))
+        self.iterations += len(leaves)
+        self.trim()
+
+    # with a node pool, prune the tree when it is full. only called between iterations, when no selected
+    # path is waiting for its result
+    def trim(self):
+        if self.pool is not None and self.pool.full():
+            self.pool.prune(self.root)
+
+    # ask a running build_tree()/uct_search() to return. safe to call from another thread
+    def stop(self):
+        self.stopped = True
+
+    # the move the search would make now, or None if it has not run yet
+    def best_move(self):
+        if self.root is None or not self.root.children:
+            return None
         # return the child with the formula: argmax(Q / N)
-        index = np.argmax([child.win / child.encounter
-                              for child in root_state.children])
-        decision = root_state.children[index].move
+        index = argmax([child.win / child.encounter
+                        for child in self.root.children])
+        decision = self.child_move(self.root, self.root.children[index])
         return [decision[0], decision[1]]
 
+    # the move that leads from parent to child. this is child.move unless the child is shared through
+    # the transposition table and was first reached from another parent
+    def child_move(self, parent, child):
+        return parent.grid.cells(child.grid.occupied & ~parent.grid.occupied)[0]
+
+    # True if the move the search would make now is also the most visited one, and the runner up could not
+    # catch up with its visits even if it got all the remaining iterations
+    def decided(self, remaining):
+        children = self.root.children
+        if remaining is None or len(children) < 2 or self.root.options:
+            return False
+        by_visits = sorted(children, key=lambda child: child.encounter, reverse=True)
+        if list(self.child_move(self.root, by_visits[0])) != self.best_move():
+            return False
+        return by_visits[0].encounter - by_visits[1].encounter > remaining
+
     # responsible for expand the next node to simulate. will only be called on the root
     # by the design of the game the root state must not be terminal. otherwise the MCTS AI won't be called
     def selection(self, state):
         next_state = state
+        self.path = [state]
         # need to make sure that get_options and check_win
         while not next_state.game_over:
             # if the current node is not fully expanded
             # meaning the next move option list is not empty, as every time a child is created, an option will be popped
-            if len(next_state.options):
-                return self.expansion(next_state)
+            if len(next_state.options) and self.widen(next_state):
+                child = self.expansion(next_state)
+                self.path.append(child)
+                return child
             # if the root is fully expanded
             else:
                 next_state = self.best_child(next_state)
+                self.path.append(next_state)
         return next_state
 
+    # True if state may get another child: always, unless progressive widening holds it back
+    def widen(self, state):
+        if self.widening is None:
+            return True
+        base, exponent = self.widening
+        return len(state.children) < max(1, ceil(base * state.encounter ** exponent))
+
     # expand one child at a time of the parameter state
     def expansion(self, parent):
+        if self.stats is not None:
+            span = Span(EXPANSION, self.hooks)
+        # the first time, the moves that are the same as another one by symmetry are dropped
+        if self.symmetries is not None and not parent.children:
+            parent.options = self.symmetries.distinct_moves(parent.grid, parent.options)
+        # with a prior, the options are sorted by it the first time, so that the best is taken first
+        if self.prior is not None and parent.option_priors is None:
+            priors = self.prior.evaluate(parent.grid, parent.player, parent.options)
+            order = sorted(range(len(priors)), key=lambda k: priors[k])
+            parent.options = [parent.options[k] for k in order]
+            parent.option_priors = [priors[k] for k in order]
         # get the position to put the next piece
-        next_pos = parent.options.pop(0)
-        # create a child state
-        child = State()
-        child.constructor_move(parent, next_pos)
+        next_pos = parent.options.pop()
+        prior = parent.option_priors.pop() if parent.option_priors else 1.0
+        # share the node if the position is already in the tree, found through the Zobrist key
+        # which is worked out from the parent's key without building the child's board
+        if self.table is not None:
+            grid = parent.grid
+            i = grid.index(next_pos[0], next_pos[1])
+            key = grid.hash ^ grid.zobrist.keys[parent.player][i]
+            if parent.player == 'b':
+                key ^= grid.zobrist.side
+            child = self.table.get(key)
+            if child is None:
+                child = State()
+                child.constructor_move(parent, next_pos)
+                # a shared node keeps the prior of the move it was first reached by
+                child.prior = prior
+                self.table.store(key, child)
+        else:
+            # create a child state
+            child = self.pool.node() if self.pool is not None else State()
+            child.constructor_move(parent, next_pos)
+            child.prior = prior
         # the above two steps guarantees that the child's game over indicator is correctly updated
         # append the new child to the root state
         parent.children.append(child)
+        if self.stats is not None:
+            self.stats.expanded += 1
+            self.stats.phase_seconds[EXPANSION] += span.end()
         return child
 
     # apply the evaluation function and return the best child
     def best_child(self, parent):
+        # with a prior, PUCT: argmax (Q / N + c * P * sqrt(N_parent) / (1 + N))
+        if self.prior is not None:
+            scale = self.puct * sqrt(parent.encounter)
+            index = argmax([child.win / child.encounter + scale * child.prior / (1 + child.encounter)
+                            for child in parent.children])
+            return parent.children[index]
         # argmax (Q / N + c * sqrt(ln(N) / N))
-        index = np.argmax([child.win / child.encounter + 2 * sqrt(log(parent.encounter) / child.encounter)
-                          for child in parent.children])
+        index = argmax([child.win / child.encounter + 2 * sqrt(log(parent.encounter) / child.encounter)
+                        for child in parent.children])
         return parent.children[index]
 
     # keeps randomly playing till a terminal state is met
+    # the playout runs on the starting state's own board and is taken back afterwards,
+    # so no State or board is created per simulated move
     def simulation(self, starting_state):
-        cur_state = starting_state
-        # create a sandbox to simulate on
-        next_state = State()
-        while not cur_state.game_over:
-            # randomly generate a position to put the next piece
-            next_pos = cur_state.options.pop(random.randint(0, len(cur_state.options) - 1))
-            # apply the move on the sandbox
-            next_state.constructor_move(cur_state, next_pos)
-            # move on to the next player
-            cur_state = next_state
-        return cur_state.winner
+        if starting_state.game_over:
+            return starting_state.winner
+        started = time.time()
+        if self.policy is None:
+            winner = starting_state.grid.random_playout(starting_state.player)
+        else:
+            winner = self.policy.playout(starting_state.grid, starting_state.player)
+        self.rollout_time += time.time() - started
+        self.rollouts += 1
+        if self.stats is not None:
+            self.stats.rollouts += 1
+            self.stats.rollout_moves += starting_state.grid.playout_length
+        return winner
+
+    # how many random playouts per second this search has been running
+    def rollout_rate(self):
+        if self.rollout_time == 0:
+            return 0.0
+        return self.rollouts / self.rollout_time
 
     def back_propagation(self, to_update, result):
+        # with a transposition table, go up the path the selection took (to_update is its last node)
+        if self.table is not None:
+            for node in reversed(self.path):
+                node.encounter += 1
+                if result == node.player:
+                    node.win -= 1
+                else:
+                    node.win += 1
+            return
         # keeps going up
         while to_update is not None:
             # update how many times we have seen the current state
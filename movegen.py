@@ -0,0 +1,103 @@
+from __future__ import absolute_import, division, print_function
+import random
+
+BOX = 'box'
+NEIGHBOURHOOD = 'neighbourhood'
+ORDERS = ('raster', 'center', 'recent', 'random')
+
+
+# decides which empty spots are worth considering as the next move
+# the generator itself only holds precomputed tables, the per board part is a small "frontier" value
+# that the BitBoard updates on every placement with advance(). the frontier's reach() is a mask of the
+# spots close enough to the pieces, so the candidates are reach & ~occupied without looking at the board
+# two policies are supported:
+#   'box': the bounding box of the pieces grown by radius (the frontier is the box itself)
+#   'neighbourhood': every spot within radius of some piece (the frontier is the mask of those spots)
+# and the candidates can be listed in these orders:
+#   'raster': row by row, 'center': closest to the center first,
+#   'recent': closest to the last move first, 'random': shuffled
+class MoveGenerator:
+    # generator constructor. builds the tables for a board of the given size
+    def __init__(self, size=11, radius=1, policy=BOX, order='raster'):
+        if policy not in (BOX, NEIGHBOURHOOD):
+            raise ValueError("unknown move policy: {0}".format(policy))
+        if order not in ORDERS:
+            raise ValueError("unknown move order: {0}".format(order))
+        self.size = size
+        self.stride = size + 1
+        self.radius = radius
+        self.policy = policy
+        self.order = order
+        # one bit at column 0 of every row, see BitBoard
+        self.column_fill = 0
+        for r in range(size):
+            self.column_fill |= 1 << (r * self.stride)
+        # the spots within radius of every spot, only needed by the neighbourhood policy
+        self.neighbours = {}
+        if policy == NEIGHBOURHOOD:
+            for r in range(size):
+                for c in range(size):
+                    self.neighbours[r * self.stride + c] = self.box_mask(
+                        (max(0, r - radius), min(size - 1, r + radius),
+                         max(0, c - radius), min(size - 1, c + radius)))
+        # distance of every spot from the center, used by the 'center' order
+        center = size // 2
+        self.center_distance = {}
+        for r in range(size):
+            for c in range(size):
+                self.center_distance[r * self.stride + c] = max(abs(r - center), abs(c - center))
+
+    # the frontier of an empty board
+    def start(self):
+        if self.policy == BOX:
+            return None
+        return 0
+
+    # the frontier after a piece is put on spot i. frontiers are never modified in place,
+    # so a board can take a move back by restoring the previous value
+    def advance(self, frontier, i):
+        if self.policy == NEIGHBOURHOOD:
+            return frontier | self.neighbours[i]
+        r, c = divmod(i, self.stride)
+        grown = (max(0, r - self.radius), min(self.size - 1, r + self.radius),
+                 max(0, c - self.radius), min(self.size - 1, c + self.radius))
+        if frontier is None:
+            return grown
+        return (min(frontier[0], grown[0]), max(frontier[1], grown[1]),
+                min(frontier[2], grown[2]), max(frontier[3], grown[3]))
+
+    # the mask of the spots covered by the frontier, occupied or not
+    def reach(self, frontier):
+        if self.policy == NEIGHBOURHOOD:
+            return frontier
+        return self.box_mask(frontier)
+
+    # a mask with every cell of the box (min_r, max_r, min_c, max_c) set
+    def box_mask(self, box):
+        if box is None:
+            return 0
+        min_r, max_r, min_c, max_c = box
+        mask = (((1 << (max_c - min_c + 1)) - 1) << min_c) * self.column_fill
+        return mask & (((1 << ((max_r - min_r + 1) * self.stride)) - 1) << (min_r * self.stride))
+
+    # put the candidate indices in the configured order. indices come in raster order
+    def arrange(self, indices, moves):
+        if self.order == 'center':
+            indices.sort(key=self.center_distance.__getitem__)
+        elif self.order == 'recent' and moves:
+            last_r, last_c = divmod(moves[-1], self.stride)
+            stride = self.stride
+            indices.sort(key=lambda i: max(abs(i // stride - last_r), abs(i % stride - last_c)))
+        elif self.order == 'random':
+            random.shuffle(indices)
+        return indices
+
+
+# generators are only tables, so boards of the same size share the default one
+defaults = {}
+
+
+def default_generator(size):
+    if size not in defaults:
+        defaults[size] = MoveGenerator(size)
+    return defaults[size]
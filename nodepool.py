@@ -0,0 +1,266 @@
+from __future__ import absolute_import, division, print_function
+import sys
+from mcts import State
+
+# the share of the capacity a full pool frees at once, so that it is not pruned again every iteration
+PRUNE = 0.25
+
+
+# the bytes of a node and everything only it refers to (its board's bits and move lists, its options),
+# not counting the tables the boards share
+def node_bytes(node):
+    grid = node.grid
+    total = sys.getsizeof(node) + sys.getsizeof(node.__dict__)
+    total += sys.getsizeof(node.options) + sum(sys.getsizeof(option) for option in node.options)
+    total += sys.getsizeof(node.children) + sys.getsizeof(node.move)
+    if grid is not None:
+        total += sys.getsizeof(grid) + sys.getsizeof(grid.__dict__) + sys.getsizeof(grid.bits)
+        total += sum(sys.getsizeof(bits) for bits in grid.bits.values()) + sys.getsizeof(grid.occupied)
+        total += sys.getsizeof(grid.moves) + sys.getsizeof(grid.hash) + sys.getsizeof(grid.frontier)
+        total += sys.getsizeof(grid.frontiers) + sum(sys.getsizeof(frontier) for frontier in grid.frontiers)
+    return total
+
+
+# a cap on the memory of an MCTS tree (see MCTS(pool=...)), in nodes or in bytes
+# bytes are turned into nodes by the size of the root at first, and of a sample of the tree at every prune,
+# as the nodes deeper down hold more moves and wider options. they are counted by sys.getsizeof, which
+# leaves out what the allocator adds, so the process grows somewhat past max_bytes
+# the pool counts the nodes of the tree. when it is full, it prunes the nodes with the fewest visits below
+# the root's children, the deepest first among equal visits, until PRUNE of the capacity is free. a node
+# never has more visits than its parent, so everything below a node has gone before it: it is a leaf when
+# it goes, and a prune frees what it needs and hardly more.
+# the move of a pruned child goes back to its parent's options and is expanded again if the search comes
+# back to it. the root and its children are never pruned, so the root's statistics (and the move the
+# search makes) are those of the whole search
+# pruned nodes are cleared and kept, and new nodes are taken from them first, so a long search under a
+# cap reuses the same node objects instead of allocating new ones
+# the pool is looked at between iterations, so with batched rollouts the tree can pass the cap by one batch
+class NodePool:
+    # pool constructor. max_nodes caps the number of nodes, max_bytes the bytes (see node_bytes)
+    def __init__(self, max_nodes=None, max_bytes=None, prune=PRUNE):
+        if max_nodes is None and max_bytes is None:
+            raise ValueError("a node pool needs max_nodes or max_bytes")
+        self.max_nodes = max_nodes
+        self.max_bytes = max_bytes
+        self.prune_share = prune
+        self.capacity = max_nodes
+        self.live = 0
+        # a prune that cannot free enough (the tree is mostly the root's children) puts the next one off
+        self.limit = max_nodes
+        self.free = []
+        self.peak = 0
+        self.prunes = 0
+        self.pruned = 0
+        self.recycled = 0
+        # the nodes the last prune was to remove
+        self.needed = 0
+
+    # count the tree of a new search, which may be kept from the last move
+    def start(self, root):
+        self.size(node_bytes(root))
+        self.live = count_nodes(root)
+        self.limit = max(self.capacity, self.live)
+        self.peak = max(self.peak, self.live)
+
+    # set the capacity from the bytes of a node
+    def size(self, node_size):
+        if self.max_bytes is not None:
+            nodes = self.max_bytes // node_size
+            self.capacity = nodes if self.max_nodes is None else min(nodes, self.max_nodes)
+
+    # a fresh node for the tree, a recycled one if there is one
+    def node(self):
+        self.live += 1
+        if self.live > self.peak:
+            self.peak = self.live
+        if self.free:
+            self.recycled += 1
+            return self.free.pop()
+        return State()
+
+    # True if the tree has reached the capacity and should be pruned before it grows further
+    def full(self):
+        return self.live >= self.limit
+
+    # prune the tree under root until PRUNE of the capacity is free. returns the number of nodes removed
+    def prune(self, root):
+        # every node below the root's children, with its parent and depth
+        candidates = []
+        nodes = []
+        pending = [(child, 1) for child in root.children]
+        while pending:
+            node, depth = pending.pop()
+            nodes.append(node)
+            for child in node.children:
+                candidates.append((child.encounter, depth + 1, node, child))
+                pending.append((child, depth + 1))
+        if self.max_bytes is not None and nodes:
+            sample = nodes[::max(1, len(nodes) // 64)]
+            self.size(sum(node_bytes(node) for node in sample) // len(sample))
+        self.needed = needed = self.live - int(self.capacity * (1 - self.prune_share))
+        removed = 0
+        if needed > 0:
+            # the fewest visits first, and the deepest of those: a node comes after everything below it
+            candidates.sort(key=lambda candidate: (candidate[0], -candidate[1]))
+            for visits, depth, node, child in candidates:
+                if removed >= needed:
+                    break
+                # already gone with a node above it, should the visits have been counted out of step
+                if child.grid is None:
+                    continue
+                removed += self.release(node, child)
+        self.live -= removed
+        self.prunes += 1
+        self.pruned += removed
+        # if the tree is still too big, the root's children fill it: wait for another share before trying again
+        self.limit = max(self.capacity, self.live + int(self.capacity * self.prune_share))
+        return removed
+
+    # take child and its subtree off node, putting the child's move back into node's options
+    # returns the number of nodes removed
+    def release(self, node, child):
+        move = child.move
+        node.children.remove(child)
+        node.options.insert(0, move)
+        if node.option_priors is not None:
+            node.option_priors.insert(0, child.prior)
+        removed = 0
+        pending = [child]
+        while pending:
+            current = pending.pop()
+            pending.extend(current.children)
+            # cleared, so that the boards and options it held can be freed
+            State.__init__(current)
+            self.free.append(current)
+            removed += 1
+        # recycled nodes wait for the next expansions, a share of the capacity is enough
+        del self.free[int(self.capacity * self.prune_share):]
+        return removed
+
+    def stats(self):
+        return {'capacity': self.capacity, 'live': self.live, 'peak': self.peak, 'prunes': self.prunes,
+                'pruned': self.pruned, 'recycled': self.recycled}
+
+
+# the number of nodes of the tree under root
+def count_nodes(root):
+    count = 0
+    pending = [root]
+    while pending:
+        node = pending.pop()
+        count += 1
+        pending.extend(node.children)
+    return count
+
+
+# one search of the stress benchmark below, run in a process of its own: budget iterations from the
+# opening of a size x size board, under a pool of max_bytes if given. returns what it got through:
+# the iterations, whether it ran out of memory, its peak RSS (MB), seconds and the pool's counters
+def stress_run(size, budget, max_bytes=None):
+    import gc
+    import random
+    import resource
+    import time
+    from config import GameConfig
+    from mcts import MCTS
+    random.seed(1)
+    board = GameConfig(size).new_board()
+    middle = size // 2
+    for piece, (r, c) in zip('bwb', ((middle, middle), (middle, middle + 1), (middle + 1, middle))):
+        board.set_piece(r, c, piece)
+    pool = NodePool(max_bytes=max_bytes) if max_bytes else None
+    search = MCTS(board, 'w', budget=budget, pool=pool)
+    search.start()
+    started = time.time()
+    failed = False
+    try:
+        while search.iterations < budget:
+            search.step(min(256, budget - search.iterations))
+    except MemoryError:
+        failed = True
+    # the tree goes before the numbers are put together, so that they can be after a MemoryError
+    # its nodes point at their parents, so it takes a collection to free them
+    search.root = None
+    search.path = []
+    gc.collect()
+    return {'iterations': search.iterations, 'out_of_memory': failed, 'seconds': time.time() - started,
+            'peak_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            'pool': pool.stats() if pool is not None else None}
+
+
+# check the prunes of a search under a pool of max_nodes: every prune must remove the nodes it needed and
+# no more, and the pool's count must stay that of the tree. returns a list of what went wrong
+def prune_check(size=15, max_nodes=2000, budget=6000):
+    import random
+    from config import GameConfig
+    from mcts import MCTS
+    random.seed(1)
+    board = GameConfig(size).new_board()
+    middle = size // 2
+    for piece, (r, c) in zip('bwb', ((middle, middle), (middle, middle + 1), (middle + 1, middle))):
+        board.set_piece(r, c, piece)
+    pool = NodePool(max_nodes=max_nodes)
+    search = MCTS(board, 'w', budget=budget, pool=pool)
+    search.start()
+    problems = []
+    prunes, pruned = 0, 0
+    while search.iterations < budget:
+        search.step()
+        if pool.prunes != prunes:
+            removed = pool.pruned - pruned
+            if removed != pool.needed:
+                problems.append("prune {0} removed {1} nodes for {2}".format(pool.prunes, removed, pool.needed))
+            prunes, pruned = pool.prunes, pool.pruned
+    if pool.live != count_nodes(search.root):
+        problems.append("the pool counts {0} nodes, the tree has {1}".format(pool.live, count_nodes(search.root)))
+    if not prunes:
+        problems.append("the tree was never pruned")
+    return problems
+
+
+# stress benchmark: large budgets under a fixed memory limit, e.g.
+#   python nodepool.py --size 15 --budget 40000 --limit 150
+# each search runs in a child process whose address space is capped at --limit MB (RLIMIT_AS, which,
+# unlike RLIMIT_RSS, Linux enforces), once with a plain tree and once with a NodePool of --share of the limit
+# python nodepool.py --check runs prune_check() instead, with exit status 1 if it finds a problem
+if __name__ == '__main__':
+    import argparse
+    import json
+    import os
+    import resource
+    import subprocess
+    parser = argparse.ArgumentParser(description="Run large MCTS budgets under a memory limit, with and without a node pool.")
+    parser.add_argument('--size', type=int, default=15)
+    parser.add_argument('--budget', type=int, default=40000)
+    parser.add_argument('--limit', type=int, default=150, help="memory limit of the searches in MB")
+    parser.add_argument('--share', type=float, default=0.5, help="share of the limit given to the node pool")
+    parser.add_argument('--check', action='store_true', help="check the size of the prunes and exit")
+    args = parser.parse_args()
+    if args.check:
+        problems = prune_check()
+        for problem in problems:
+            print(problem)
+        sys.exit(1 if problems else 0)
+    limit = args.limit << 20
+
+    def capped():
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+    for max_bytes in (None, int(limit * args.share)):
+        code = "import json, nodepool; print(json.dumps(nodepool.stress_run({0}, {1}, {2})))".format(
+            args.size, args.budget, max_bytes)
+        # the child imports nodepool from here, wherever the benchmark is started from
+        run = subprocess.run([sys.executable, '-c', code], stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                             preexec_fn=capped, cwd=os.path.dirname(os.path.abspath(__file__)))
+        if run.returncode:
+            # the interpreter itself can fail to get memory outside the search, or be killed for it.
+            # any other failure is reported as it is
+            error = run.stderr.decode().strip().splitlines()
+            out_of_memory = run.returncode < 0 or any('MemoryError' in line for line in error[-1:])
+            result = {'iterations': None, 'out_of_memory': out_of_memory, 'returncode': run.returncode,
+                      'error': error[-1:] if out_of_memory else error}
+        else:
+            result = json.loads(run.stdout.decode())
+        result['pool_bytes'] = max_bytes
+        print(json.dumps(result))
+        sys.stdout.flush()
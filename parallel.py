@@ -0,0 +1,345 @@
+from __future__ import absolute_import, division, print_function
+import multiprocessing
+import random
+import sys
+import time
+from math import sqrt, log
+from mcts import MCTS, State, BUDGET
+
+ROOT = 'root'
+LEAF = 'leaf'
+TREE = 'tree'
+# random games every worker plays from a leaf in 'leaf' mode: one map per leaf costs far more than a game,
+# so a task plays several
+LEAF_ROLLOUTS = 8
+# the children an expansion is expected to allocate in the shared tree: the options of a position under the
+# default move rule, about 30 on an opening and more as the pieces spread
+BRANCHING = 48
+# node states in the shared tree
+UNEXPANDED = 0
+EXPANDED = 1
+WON = 2  # the move into the node won the game
+DRAWN = 3  # the board is full
+
+
+# runs in a worker process: build one whole tree and return the statistics of the root's children
+def root_worker(task):
+    board, player, budget, seed = task
+    random.seed(seed)
+    search = MCTS(board, player, budget=budget)
+    root_state = search.build_tree()
+    return [(child.move, child.win, child.encounter) for child in root_state.children]
+
+
+# runs in a worker process: play some random games from a leaf and return the winners
+def leaf_worker(task):
+    board, player, count, seed = task
+    random.seed(seed)
+    return [board.random_playout(player) for _ in range(count)]
+
+
+# MCTS spread over a pool of worker processes
+# 'root' mode (root parallelisation): every worker builds its own tree with an equal share of the budget,
+# with its own random seed. the visits and wins of the root's children are then summed over the workers
+# and the move is picked with the usual argmax(Q / N)
+# 'leaf' mode (leaf parallelisation): one tree is built in this process, and every selected leaf is
+# simulated leaf_rollouts times by every worker, so each iteration adds leaf_rollouts results per worker
+# with a seed, the workers get fixed seeds and the result does not depend on the scheduling
+class ParallelMCTS:
+    # constructor of a parallel search. workers defaults to the number of cores
+    # a pool can be shared between searches, otherwise one is started (and closed) by each search
+    def __init__(self, grid, player, workers=None, mode=ROOT, seed=None, budget=None, pool=None,
+                 leaf_rollouts=LEAF_ROLLOUTS):
+        if mode not in (ROOT, LEAF):
+            raise ValueError("unknown parallel mode: {0}".format(mode))
+        self.initial_board = grid
+        self.ai_role = player
+        self.workers = workers or multiprocessing.cpu_count()
+        self.mode = mode
+        self.seed = seed
+        self.budget = budget
+        self.pool = pool
+        self.leaf_rollouts = leaf_rollouts
+        # number of playouts over all the workers, to report the search speed
+        self.rollouts = 0
+
+    # the random seed of a worker's task
+    def task_seed(self, *keys):
+        if self.seed is None:
+            return random.SystemRandom().getrandbits(64)
+        seed = self.seed
+        for key in keys:
+            seed = seed * 1000003 + key
+        return seed
+
+    # high level interface, same as MCTS.uct_search
+    def uct_search(self):
+        pool = self.pool
+        if pool is None:
+            pool = multiprocessing.Pool(self.workers)
+        try:
+            if self.mode == ROOT:
+                stats = self.root_search(pool)
+            else:
+                stats = self.leaf_search(pool)
+        finally:
+            if self.pool is None:
+                pool.close()
+                pool.join()
+        # return the child with the formula: argmax(Q / N)
+        decision = max(stats, key=lambda move: stats[move][0] / stats[move][1])
+        return [decision[0], decision[1]]
+
+    # root parallelisation. returns {move: [win, encounter]} summed over the workers
+    def root_search(self, pool):
+        budget = self.budget if self.budget is not None else BUDGET
+        tasks = []
+        for worker in range(self.workers):
+            # split the budget as evenly as possible
+            share = budget // self.workers + (1 if worker < budget % self.workers else 0)
+            tasks.append((self.initial_board, self.ai_role, share, self.task_seed(worker)))
+        stats = {}
+        # map keeps the worker order, so the sums are the same whichever worker finishes first
+        for children in pool.map(root_worker, tasks):
+            for move, win, encounter in children:
+                total = stats.setdefault(move, [0, 0])
+                total[0] += win
+                total[1] += encounter
+                self.rollouts += encounter
+        return stats
+
+    # leaf parallelisation. returns {move: [win, encounter]} of the root's children
+    def leaf_search(self, pool):
+        budget = self.budget if self.budget is not None else BUDGET
+        # the tree is handled by a normal MCTS in this process, only the playouts are sent out
+        search = MCTS(self.initial_board, self.ai_role)
+        root_state = State()
+        root_state.constructor_params(self.initial_board, self.ai_role)
+        for i in range(0, budget):
+            next_try = search.selection(root_state)
+            if next_try.game_over:
+                results = [next_try.winner] * (self.workers * self.leaf_rollouts)
+            else:
+                tasks = [(next_try.grid, next_try.player, self.leaf_rollouts, self.task_seed(i, worker))
+                         for worker in range(self.workers)]
+                results = [winner for winners in pool.map(leaf_worker, tasks) for winner in winners]
+            for terminal in results:
+                search.back_propagation(next_try, terminal)
+            self.rollouts += len(results)
+        return dict((child.move, [child.win, child.encounter]) for child in root_state.children)
+
+
+# a search tree shared by several processes, stored as arrays indexed by node id (node 0 is the root)
+# the arrays live in shared memory and are handed to the worker processes when they start
+# the children of a node are allocated as one block, so a node only needs its first child and the count
+# allocating a block and the virtual losses take the lock, the virtual losses once for the whole path.
+# a lost virtual loss would stay for the rest of the search (and could take a node's count below zero),
+# while the visit and win counters are updated without locking: a lost update there now and then costs
+# one sample, while a lock would serialise the back-ups
+# when the arrays are full, the leaves stay leaves: the search goes on, its playouts starting from them
+class SharedTree:
+    # tree constructor. capacity is the maximum number of nodes
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.visits = multiprocessing.RawArray('l', capacity)
+        self.wins = multiprocessing.RawArray('l', capacity)
+        # iterations currently running through a node, counted as losses while they last
+        self.virtual = multiprocessing.RawArray('l', capacity)
+        self.move = multiprocessing.RawArray('l', capacity)
+        self.first_child = multiprocessing.RawArray('l', capacity)
+        self.child_count = multiprocessing.RawArray('l', capacity)
+        self.state = multiprocessing.RawArray('b', capacity)
+        self.size = multiprocessing.RawValue('l', 1)
+        # expansions refused because the tree was full
+        self.refused = multiprocessing.RawValue('l', 0)
+        self.lock = multiprocessing.Lock()
+
+    # give node its children, one per move (bit indices). returns False if another worker did it first
+    # or the tree is full, in which case the node stays a leaf
+    def expand(self, node, moves):
+        with self.lock:
+            if self.state[node] != UNEXPANDED:
+                return False
+            if self.size.value + len(moves) > self.capacity:
+                self.refused.value += 1
+                return False
+            first = self.size.value
+            for k, i in enumerate(moves):
+                self.move[first + k] = i
+            self.first_child[node] = first
+            self.child_count[node] = len(moves)
+            self.size.value = first + len(moves)
+            self.state[node] = EXPANDED
+            return True
+
+    # add delta to the virtual losses of nodes
+    def add_virtual(self, nodes, delta):
+        with self.lock:
+            for node in nodes:
+                self.virtual[node] += delta
+
+    # pick the child to descend into, by UCB where the running iterations count as losses
+    # (virtual loss), so that the workers spread over different branches
+    def best_child(self, node, exploration):
+        visits, wins, virtual = self.visits, self.wins, self.virtual
+        first = self.first_child[node]
+        parent_log = log(max(1, visits[node] + virtual[node]))
+        best, best_score = first, None
+        for child in range(first, first + self.child_count[node]):
+            n = visits[child] + virtual[child]
+            # unvisited children first
+            if n == 0:
+                return child
+            # the counters are read while other workers change them, never divide by less than one
+            n = max(1, n)
+            score = (wins[child] - virtual[child]) / n + exploration * sqrt(parent_log / n)
+            if best_score is None or score > best_score:
+                best, best_score = child, score
+        return best
+
+
+# runs in a worker process: the search loop of the tree parallel MCTS on the shared tree
+def tree_worker(tree, board, player, iterations, seed, exploration):
+    random.seed(seed)
+    other = {'b': 'w', 'w': 'b'}
+    stride = board.stride
+    for iteration in range(iterations):
+        # the board is rebuilt along the path instead of being stored in the nodes
+        node = 0
+        path = [0]
+        piece = player
+        movers = [None]
+        while tree.state[node] == EXPANDED:
+            node = tree.best_child(node, exploration)
+            i = tree.move[node]
+            r, c = divmod(i, stride)
+            board.set_piece(r, c, piece)
+            path.append(node)
+            movers.append(piece)
+            if tree.state[node] == UNEXPANDED:
+                if board.check_win(r, c):
+                    tree.state[node] = WON
+                elif not board.get_options():
+                    tree.state[node] = DRAWN
+            piece = other[piece]
+        # expand the leaf if it is not terminal, and step into one of its children
+        if tree.state[node] == UNEXPANDED:
+            options = [r * stride + c for r, c in board.get_options()]
+            if tree.expand(node, options) or tree.state[node] == EXPANDED:
+                node = tree.best_child(node, exploration)
+                r, c = divmod(tree.move[node], stride)
+                board.set_piece(r, c, piece)
+                path.append(node)
+                movers.append(piece)
+                if board.check_win(r, c):
+                    tree.state[node] = WON
+                piece = other[piece]
+        # the virtual losses go on the whole path at once, and count while the game is simulated
+        tree.add_virtual(path[1:], 1)
+        if tree.state[node] == WON:
+            result = movers[-1]
+        elif tree.state[node] == DRAWN:
+            result = 'd'
+        else:
+            result = board.random_playout(piece)
+        # update the path with the result and take the virtual losses back
+        for k in range(len(path) - 1, -1, -1):
+            node = path[k]
+            tree.visits[node] += 1
+            if k > 0:
+                if result == movers[k]:
+                    tree.wins[node] += 1
+                elif result != 'd':
+                    tree.wins[node] -= 1
+                board.undo()
+        tree.add_virtual(path[1:], -1)
+
+
+# tree parallel MCTS: all the workers run the search loop on one SharedTree
+# virtual loss keeps them apart, so the budget is not spent on duplicated shallow trees as in root mode
+# wins are counted for the player who moved into a node: +1 for a win, -1 for a loss, 0 for a draw
+# with one worker and a seed the result is reproducible. with more, it depends on the scheduling
+class TreeParallelMCTS:
+    # constructor of a tree parallel search. capacity is the size of the shared tree in nodes, by default
+    # room for the root's children and BRANCHING children per iteration
+    def __init__(self, grid, player, workers=None, seed=None, budget=None, capacity=None, exploration=2):
+        self.initial_board = grid
+        self.ai_role = player
+        self.workers = workers or multiprocessing.cpu_count()
+        self.seed = seed
+        self.budget = budget
+        self.capacity = capacity
+        self.exploration = exploration
+        # number of playouts over all the workers, to report the search speed
+        self.rollouts = 0
+        self.refused = 0
+        self.tree = None
+
+    # high level interface, same as MCTS.uct_search
+    def uct_search(self):
+        budget = self.budget if self.budget is not None else BUDGET
+        # every iteration allocates at most one block of children, of at most size ** 2 nodes
+        cells = self.initial_board.size ** 2
+        capacity = self.capacity or 1 + min(cells + budget * BRANCHING, budget * cells)
+        self.tree = tree = SharedTree(capacity)
+        processes = []
+        for worker in range(self.workers):
+            share = budget // self.workers + (1 if worker < budget % self.workers else 0)
+            if self.seed is None:
+                seed = random.SystemRandom().getrandbits(64)
+            else:
+                seed = self.seed * 1000003 + worker
+            processes.append(multiprocessing.Process(target=tree_worker, args=(
+                tree, self.initial_board.copy(), self.ai_role, share, seed, self.exploration)))
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        self.rollouts = tree.visits[0]
+        # iterations that could not grow the tree
+        self.refused = tree.refused.value
+        # return the child with the formula: argmax(Q / N)
+        first = tree.first_child[0]
+        children = [child for child in range(first, first + tree.child_count[0]) if tree.visits[child]]
+        if not children:
+            raise ValueError("the search visited no move of the root (budget {0}), or the game is over".format(budget))
+        index = max(children, key=lambda child: tree.wins[child] / tree.visits[child])
+        return list(divmod(tree.move[index], self.initial_board.stride))
+
+
+# benchmark: iterations per second of the parallel search with 1, 2, 4, ... workers
+# usage: python parallel.py [budget] [max workers] [root|leaf|tree]
+# in leaf mode the budget is the number of leaves, each played out LEAF_ROLLOUTS times by every worker
+if __name__ == '__main__':
+    from bitboard import BitBoard
+    budget = int(sys.argv[1]) if len(sys.argv) > 1 else BUDGET
+    max_workers = int(sys.argv[2]) if len(sys.argv) > 2 else multiprocessing.cpu_count()
+    mode = sys.argv[3] if len(sys.argv) > 3 else ROOT
+    if mode not in (ROOT, LEAF, TREE):
+        sys.exit("unknown parallel mode: {0}".format(mode))
+    board = BitBoard(11)
+    for r, c, piece in ((5, 5, 'b'), (5, 6, 'w'), (4, 4, 'b'), (6, 6, 'w')):
+        board.set_piece(r, c, piece)
+    workers = 1
+    baseline = None
+    while workers <= max_workers:
+        pool = multiprocessing.Pool(workers)
+        # warm the pool up so that process start-up is not timed
+        pool.map(leaf_worker, [(board, 'b', 1, worker) for worker in range(workers)])
+        if mode == TREE:
+            search = TreeParallelMCTS(board, 'b', workers=workers, seed=1, budget=budget * workers)
+        elif mode == LEAF:
+            # every leaf already gets more games with more workers
+            search = ParallelMCTS(board, 'b', workers=workers, mode=LEAF, seed=1, budget=budget, pool=pool)
+        else:
+            search = ParallelMCTS(board, 'b', workers=workers, seed=1, budget=budget * workers, pool=pool)
+        started = time.time()
+        move = search.uct_search()
+        rate = search.rollouts / (time.time() - started)
+        pool.close()
+        pool.join()
+        if baseline is None:
+            baseline = rate
+        print("workers: {0} iterations/s: {1:.0f} speedup: {2:.2f} move: {3}".format(
+            workers, rate, rate / baseline, move))
+        workers *= 2
@@ -0,0 +1,252 @@
+from __future__ import absolute_import, division, print_function
+import itertools
+import random
+from wincheck import DIRECTIONS
+
+# the threat level of an empty spot for a player: what a piece of theirs on it would make
+NONE = 0
+THREE = 1  # an open three: one more piece makes an open four
+FOUR = 2  # a four: one more piece wins, but the opponent can still block it
+OPEN_FOUR = 3  # two different spots win next move, too many to block
+FIVE = 4  # wins right away
+
+
+# the pattern tables of the threat policy for a board of the given size and winning length
+# every line of the board, in each of the four directions, is laid out as a run of consecutive bits of a
+# python integer, with length - 1 bits of wall between the lines. the window of 2 * length - 1 spots around
+# a spot along one direction is then one shift and one and away, and the pair (own pieces, pieces of the
+# other color or wall) packed into one number indexes the table of threat levels of that spot on that line
+class ThreatTables:
+    # tables constructor. the levels of every possible window are worked out up front for the usual lengths,
+    # longer runs have too many windows for that and get theirs the first time they are looked up
+    def __init__(self, size=11, length=5):
+        self.size = size
+        self.stride = size + 1
+        self.length = length
+        self.half = length - 1
+        self.width = 2 * length - 1
+        self.window = (1 << self.width) - 1
+        # position[d][i]: the bit of spot i (BitBoard index) in the layout of direction d
+        # a line gets size bits, as the diagonals are numbered by row their spots fit as well
+        slot = size + self.half
+        self.position = []
+        self.walls = []
+        for d, (dr, dc) in enumerate(DIRECTIONS):
+            position = [0] * (size * self.stride)
+            cells = 0
+            for r in range(size):
+                for c in range(size):
+                    if d == 0:
+                        line, along = r, c
+                    elif d == 1:
+                        line, along = c, r
+                    elif d == 2:
+                        line, along = r - c + size - 1, r
+                    else:
+                        line, along = r + c, r
+                    position[r * self.stride + c] = self.half + line * slot + along
+                    cells |= 1 << position[r * self.stride + c]
+            lines = size if d < 2 else 2 * size - 1
+            self.position.append(position)
+            self.walls.append(((1 << (lines * slot + 2 * self.half)) - 1) & ~cells)
+        # affected[i]: (direction, spot, position) of every spot whose window in that direction covers spot i
+        self.affected = [[] for _ in range(size * self.stride)]
+        for r in range(size):
+            for c in range(size):
+                for d, (dr, dc) in enumerate(DIRECTIONS):
+                    for k in range(-self.half, self.half + 1):
+                        new_r, new_c = r + dr * k, c + dc * k
+                        if k and 0 <= new_r < size and 0 <= new_c < size:
+                            j = new_r * self.stride + new_c
+                            self.affected[r * self.stride + c].append((d, j, self.position[d][j]))
+        # the runs of length spots through the middle of a window
+        self.runs = [((1 << length) - 1) << start for start in range(self.half + 1)]
+        self.levels = {}
+        if length <= 5:
+            others = self.width - 1
+            for cells in itertools.product((0, 1, 2), repeat=others):
+                own, blocked = 0, 0
+                for k, cell in enumerate(cells):
+                    bit = 1 << (k if k < self.half else k + 1)
+                    if cell == 1:
+                        own |= bit
+                    elif cell == 2:
+                        blocked |= bit
+                self.level(own, blocked)
+
+    # the pieces of board in the line layouts, {color: [one integer per direction]}
+    def layouts(self, board):
+        lines = {'b': [0, 0, 0, 0], 'w': [0, 0, 0, 0]}
+        for color in ('b', 'w'):
+            for i in board.indices(board.bits[color]):
+                for d in range(4):
+                    lines[color][d] |= 1 << self.position[d][i]
+        return lines
+
+    # the threat level of the middle spot of a window, given the own pieces and the blocked spots in it
+    def level(self, own, blocked):
+        code = own | blocked << self.width
+        level = self.levels.get(code)
+        if level is None:
+            placed = own | 1 << self.half
+            free = self.window & ~(placed | blocked)
+            if any(placed & run == run for run in self.runs):
+                level = FIVE
+            else:
+                wins = len(self.winning_spots(placed, free))
+                if wins >= 2:
+                    level = OPEN_FOUR
+                elif wins == 1:
+                    level = FOUR
+                elif any(len(self.winning_spots(placed | 1 << k, free & ~(1 << k))) >= 2
+                         for k in range(self.width) if (free >> k) & 1):
+                    level = THREE
+                else:
+                    level = NONE
+            self.levels[code] = level
+        return level
+
+    # the free spots that would complete a run through the middle of a window
+    def winning_spots(self, placed, free):
+        spots = set()
+        for run in self.runs:
+            missing = run & ~placed
+            if missing and missing & (missing - 1) == 0 and missing & free:
+                spots.add(missing)
+        return spots
+
+
+# tables are only tables, so boards of the same size and rules share the default ones
+defaults = {}
+
+
+def default_tables(size, length=5):
+    if (size, length) not in defaults:
+        defaults[size, length] = ThreatTables(size, length)
+    return defaults[size, length]
+
+
+# the rollout policy of plain MCTS: uniformly random moves, see BitBoard.random_playout
+class RandomPolicy:
+    # play a game to the end from board with piece to move. returns the winner's color, or 'd' for a draw
+    def playout(self, board, piece):
+        return board.random_playout(piece)
+
+
+# a rollout policy that plays like a beginner instead of at random: it always takes a winning move,
+# always blocks the opponent's winning spot and also makes a winning threat (an open four) when it can.
+# otherwise, with probability prefer, it blocks an opponent's open three or makes a three or a four of
+# its own, and else it plays a random move like RandomPolicy
+# the threat level of every empty spot, for both players, is kept in ThreatTables lookups: a new piece
+# only changes the windows of the spots up to length - 1 away on its four lines, so each move costs
+# a few dozen shifts and table lookups instead of a scan of the board
+class ThreatPolicy:
+    # policy constructor. prefer is the chance of playing a three or four rather than a random move
+    def __init__(self, prefer=0.8):
+        self.prefer = prefer
+
+    # play a game to the end from board with piece to move. the board is not modified
+    # returns the winner's color, or 'd' for a draw. the number of moves played is left in board.playout_length
+    def playout(self, board, piece):
+        tables = default_tables(board.size, board.length)
+        position, walls, window, half, width = tables.position, tables.walls, tables.window, tables.half, tables.width
+        affected, levels, level_of = tables.affected, tables.levels, tables.level
+        cells = board.size * board.stride
+        lines = tables.layouts(board)
+        # per player, the level of every spot in each direction, its best level and the spots of each level
+        direction_levels = {'b': [[0] * cells for _ in range(4)], 'w': [[0] * cells for _ in range(4)]}
+        best = {'b': [0] * cells, 'w': [0] * cells}
+        spots = {'b': [set() for _ in range(5)], 'w': [set() for _ in range(5)]}
+
+        # look the window of spot j in direction d (at position p) up again for both players
+        def update(j, d, p):
+            shift = p - half
+            black = (lines['b'][d] >> shift) & window
+            white = (lines['w'][d] >> shift) & window
+            if not black | white:
+                return
+            wall = (walls[d] >> shift) & window
+            for color, own, blocked in (('b', black, white | wall), ('w', white, black | wall)):
+                level = levels.get(own | blocked << width)
+                if level is None:
+                    level = level_of(own, blocked)
+                spot_levels = direction_levels[color]
+                if level != spot_levels[d][j]:
+                    spot_levels[d][j] = level
+                    new = max(spot_levels[0][j], spot_levels[1][j], spot_levels[2][j], spot_levels[3][j])
+                    old = best[color][j]
+                    if new != old:
+                        best[color][j] = new
+                        if old:
+                            spots[color][old].discard(j)
+                        if new:
+                            spots[color][new].add(j)
+
+        occupied = board.occupied
+        for j in board.indices(board.full & ~occupied):
+            for d in range(4):
+                update(j, d, position[d][j])
+        # the random moves come from the move generator, as in random_playout
+        movegen = board.movegen
+        frontier = board.frontier
+        reach = movegen.reach(frontier)
+        if occupied:
+            candidates = board.indices(reach & ~occupied)
+        else:
+            candidates = [(board.size // 2) * board.stride + board.size // 2]
+        other = {'b': 'w', 'w': 'b'}
+        randrange = random.randrange
+        chance = random.random
+        played = 0
+        winner = 'd'
+        while True:
+            mine, theirs = spots[piece], spots[other[piece]]
+            if mine[FIVE]:
+                winner = piece
+                played += 1
+                break
+            if theirs[FIVE]:
+                i = random.choice(list(theirs[FIVE]))
+            elif mine[OPEN_FOUR]:
+                i = random.choice(list(mine[OPEN_FOUR]))
+            elif (theirs[OPEN_FOUR] or mine[FOUR] or mine[THREE]) and chance() < self.prefer:
+                if theirs[OPEN_FOUR]:
+                    i = random.choice(list(theirs[OPEN_FOUR]))
+                else:
+                    i = random.choice(list(mine[FOUR] | mine[THREE]))
+            else:
+                # a random candidate. spots taken by a threat move are still in the list and are skipped here
+                i = None
+                while candidates:
+                    k = randrange(len(candidates))
+                    j = candidates[k]
+                    candidates[k] = candidates[-1]
+                    candidates.pop()
+                    if not (occupied >> j) & 1:
+                        i = j
+                        break
+                if i is None:
+                    break
+            occupied |= 1 << i
+            played += 1
+            for d in range(4):
+                lines[piece][d] |= 1 << position[d][i]
+            for color in ('b', 'w'):
+                if best[color][i]:
+                    spots[color][best[color][i]].discard(i)
+                    best[color][i] = 0
+            for d, j, p in affected[i]:
+                if not (occupied >> j) & 1:
+                    update(j, d, p)
+            frontier = movegen.advance(frontier, i)
+            new_reach = movegen.reach(frontier)
+            if new_reach != reach:
+                candidates.extend(board.indices(new_reach & ~reach & ~occupied))
+                reach = new_reach
+            piece = other[piece]
+        board.playout_length = played
+        return winner
+
+
+# the rollout policies by name, e.g. for command line options
+POLICIES = {'random': RandomPolicy, 'threat': ThreatPolicy}
@@ -0,0 +1,54 @@
+from __future__ import absolute_import, division, print_function
+from policy import default_tables, NONE, THREE, FOUR, OPEN_FOUR, FIVE
+
+# the score of a move by the threat level it makes on each of its lines, for the player making it (attack)
+# and for the opponent whose spot it takes (defence). a line of each level adds its score, so two threes
+# through one spot count more than one
+ATTACK = {NONE: 0, THREE: 8, FOUR: 12, OPEN_FOUR: 100, FIVE: 10000}
+DEFENCE = {NONE: 0, THREE: 6, FOUR: 8, OPEN_FOUR: 60, FIVE: 2000}
+# every move gets this much, so that quiet moves keep a small chance
+BASE = 1
+# and this much for each piece next to it
+NEIGHBOUR = 1
+
+
+# a fast evaluator of the candidate moves of a position, used by MCTS to order expansion and as the
+# prior of the PUCT formula. the moves are scored from the threat tables of the rollout policy
+# (see policy.ThreatTables): two table lookups per line through the spot, plus the pieces around it
+class ThreatPrior:
+    # the prior probability of each of the moves (a list of (row, column)) for player on board
+    # the probabilities add up to 1
+    def evaluate(self, board, player, moves):
+        tables = default_tables(board.size, board.length)
+        position, walls, window, half, width = tables.position, tables.walls, tables.window, tables.half, tables.width
+        levels, level_of = tables.levels, tables.level
+        lines = tables.layouts(board)
+        own, other = lines[player], lines['w' if player == 'b' else 'b']
+        stride = board.stride
+        occupied = board.occupied
+        scores = []
+        for r, c in moves:
+            i = r * stride + c
+            score = BASE
+            for d in range(4):
+                shift = position[d][i] - half
+                mine = (own[d] >> shift) & window
+                theirs = (other[d] >> shift) & window
+                if not mine | theirs:
+                    continue
+                wall = (walls[d] >> shift) & window
+                level = levels.get(mine | (theirs | wall) << width)
+                if level is None:
+                    level = level_of(mine, theirs | wall)
+                score += ATTACK[level]
+                level = levels.get(theirs | (mine | wall) << width)
+                if level is None:
+                    level = level_of(theirs, mine | wall)
+                score += DEFENCE[level]
+            # the 8 spots around i, where they are on the board
+            for j in (i - stride - 1, i - stride, i - stride + 1, i - 1, i + 1, i + stride - 1, i + stride, i + stride + 1):
+                if j >= 0 and (occupied >> j) & 1:
+                    score += NEIGHBOUR
+            scores.append(score)
+        total = sum(scores)
+        return [score / total for score in scores]
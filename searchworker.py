@@ -0,0 +1,128 @@
+from __future__ import absolute_import, division, print_function
+import multiprocessing
+import threading
+import time
+from mcts import MCTS, BUDGET
+
+# iterations run between two looks at the cancel flag
+STEP = 32
+# seconds between two progress messages
+PROGRESS_INTERVAL = 0.1
+
+
+# runs in the worker process: answers search requests until it gets None
+# every request is a dict with 'kind' ('search' or 'reset') and, for a search, 'request' (its number),
+# 'board', 'player' and 'budget'. the replies are dicts with 'kind' ('progress', 'move' or 'cancelled'),
+# the request number, the iterations so far and the best move so far ('move' when done)
+# cancel holds the number of the request to drop; it is looked at every STEP iterations
+# one MCTS per color is kept between requests, so the tree carries over from move to move
+def search_worker(requests, replies, cancel):
+    searches = {}
+    while True:
+        request = requests.get()
+        if request is None:
+            break
+        if request['kind'] == 'reset':
+            searches.clear()
+            continue
+        number, board, player = request['request'], request['board'], request['player']
+        budget = request['budget'] or BUDGET
+        search = searches.get(player)
+        if search is None:
+            search = MCTS(board, player)
+            searches[player] = search
+        else:
+            search.update(board)
+        search.start()
+        reported = time.time()
+        while search.iterations < budget and cancel.value != number:
+            search.step(min(STEP, budget - search.iterations))
+            if time.time() - reported >= PROGRESS_INTERVAL:
+                reported = time.time()
+                replies.put({'kind': 'progress', 'request': number, 'iterations': search.iterations,
+                             'budget': budget, 'move': search.best_move()})
+        if cancel.value == number:
+            # the tree may be half built for a position that will not be played, start the next one afresh
+            searches.pop(player, None)
+            replies.put({'kind': 'cancelled', 'request': number, 'iterations': search.iterations,
+                         'budget': budget, 'move': None})
+        else:
+            replies.put({'kind': 'move', 'request': number, 'iterations': search.iterations,
+                         'budget': budget, 'move': search.best_move(),
+                         'rate': search.rollout_rate(), 'reused': search.reused})
+
+
+# MCTS moves computed by a separate process, so that the caller (the pygame loop) never waits for a search
+# and the search does not share the GIL with it. the board is sent to the worker as a copy, so the caller
+# keeps the only board that is ever played on, and applies the move itself when it arrives
+# the replies are handed to deliver(message) from a listener thread, e.g. to post them as pygame events
+class BackgroundSearch:
+    # constructor. the worker process is started by the first search
+    def __init__(self, deliver, budget=None):
+        self.deliver = deliver
+        self.budget = budget
+        self.process = None
+        self.requests = None
+        self.count = 0
+        # the request being searched, None when idle
+        self.pending = None
+
+    # start the worker process and the thread that passes its replies on
+    def launch(self):
+        # a fresh interpreter rather than a fork of the one running the GUI
+        context = multiprocessing.get_context('spawn')
+        self.requests = context.Queue()
+        self.replies = context.Queue()
+        self.cancel_flag = context.Value('l', -1, lock=False)
+        self.process = context.Process(target=search_worker, args=(self.requests, self.replies, self.cancel_flag))
+        self.process.daemon = True
+        self.process.start()
+        self.listener = threading.Thread(target=self.listen)
+        self.listener.daemon = True
+        self.listener.start()
+
+    # runs in the listener thread
+    def listen(self):
+        while True:
+            message = self.replies.get()
+            if message is None:
+                break
+            if message['kind'] != 'progress' and message['request'] == self.pending:
+                self.pending = None
+            self.deliver(message)
+
+    # ask for the move of player on board. returns the request number the replies will carry
+    def search(self, board, player):
+        if self.process is None:
+            self.launch()
+        self.count += 1
+        self.pending = self.count
+        self.requests.put({'kind': 'search', 'request': self.count, 'board': board.copy(),
+                           'player': player, 'budget': self.budget})
+        return self.count
+
+    # drop the running search, if any. its 'cancelled' reply still comes
+    def cancel(self):
+        if self.pending is not None:
+            self.cancel_flag.value = self.pending
+
+    # cancel and forget the trees kept for the game, e.g. when a new game starts
+    def reset(self):
+        self.cancel()
+        if self.process is not None:
+            self.requests.put({'kind': 'reset'})
+
+    # True while a search is running
+    def busy(self):
+        return self.pending is not None
+
+    # stop the worker process
+    def close(self):
+        if self.process is None:
+            return
+        self.cancel()
+        self.requests.put(None)
+        self.process.join(5)
+        self.replies.put(None)
+        self.listener.join(5)
+        self.process = None
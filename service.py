@@ -0,0 +1,515 @@
+from __future__ import absolute_import, division, print_function
+import argparse
+import asyncio
+import collections
+import itertools
+import json
+import multiprocessing
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from config import GameConfig
+from mcts import MCTS, BUDGET
+
+# rollouts played at once by a worker in one round, shared out evenly between the games it is searching
+BATCH = 64
+# requests accepted at once. the next ones wait (or, over the socket, are not read) until one is answered
+MAX_PENDING = 256
+# a search stops this many seconds before its deadline, to leave time for the reply
+MARGIN = 0.02
+# the search trees a worker keeps for the next move of a game, the least recently used one goes first
+MAX_TREES = 64
+# the latencies the percentiles are taken over
+LATENCY_WINDOW = 2000
+
+
+# raised for a request that got no move by its deadline
+class DeadlineExceeded(Exception):
+    pass
+
+
+# one search in a worker: the request, and the MCTS running it
+class Job:
+    def __init__(self, request, search):
+        self.id = request['id']
+        self.budget = request['budget']
+        self.deadline = request['deadline']
+        self.search = search
+        self.started = time.time()
+
+
+# runs in a worker process: searches the positions it gets from requests until it gets None
+# a request is a dict with 'kind': 'search' (with 'id', 'game', 'board', 'player', 'budget' and 'deadline',
+# an absolute time.time()), 'cancel' (with 'id') or 'forget' (with 'game', whose trees are dropped)
+# the searches take turns: every round each running search selects its share of batch leaves (at least one),
+# the games of all the leaves of the round, whatever search they come from, are played by one BatchRollout
+# per board size, and the results are backed up. a search replies when it has run its budget, or with the
+# best move so far when its deadline is near ('partial'); 'expired' if it has no move by then
+# the MCTS of each (game, player) is kept for the next request, so the tree carries over as in searchworker
+def service_worker(number, requests, replies, batch):
+    from batchrollout import BatchRollout
+    searches = collections.OrderedDict()
+    engines = {}
+    jobs = []
+    rounds = 0
+    rollouts = 0
+    while True:
+        # take every waiting request, only sleeping on the queue when there is nothing to search
+        while True:
+            try:
+                request = requests.get(block=not jobs)
+            except queue.Empty:
+                break
+            if request is None:
+                return
+            if request['kind'] == 'forget':
+                for player in ('b', 'w'):
+                    searches.pop((request['game'], player), None)
+            elif request['kind'] == 'cancel':
+                jobs = [job for job in jobs if job.id != request['id']]
+            else:
+                tree = (request['game'], request['player'])
+                search = searches.pop(tree, None)
+                if search is None:
+                    search = MCTS(request['board'], request['player'])
+                else:
+                    search.update(request['board'])
+                searches[tree] = search
+                while len(searches) > MAX_TREES:
+                    searches.popitem(last=False)
+                search.start()
+                jobs.append(Job(request, search))
+        share = max(1, batch // len(jobs))
+        selected = []
+        for job in jobs:
+            leaves, paths = job.search.select_leaves(min(share, job.budget - job.search.iterations))
+            selected.append((job, leaves, paths))
+        # the leaves still to be played, by board size and rules, across all the games
+        playing = {}
+        for job, leaves, paths in selected:
+            for leaf in leaves:
+                if not leaf.game_over:
+                    playing.setdefault((leaf.grid.size, leaf.grid.length), []).append(leaf)
+        winners = {}
+        for rules, leaves in playing.items():
+            if rules not in engines:
+                engines[rules] = BatchRollout(*rules)
+            for leaf, winner in zip(leaves, engines[rules].play([leaf.grid for leaf in leaves],
+                                                                [leaf.player for leaf in leaves])):
+                winners[id(leaf)] = winner
+            rollouts += len(leaves)
+        rounds += 1
+        now = time.time()
+        running = []
+        for job, leaves, paths in selected:
+            job.search.back_up_leaves(leaves, paths, [winners[id(leaf)] for leaf in leaves if not leaf.game_over])
+            done = job.search.iterations >= job.budget
+            if not done and now < job.deadline - MARGIN:
+                running.append(job)
+                continue
+            move = job.search.best_move()
+            reply = {'kind': 'move' if move is not None else 'expired', 'id': job.id, 'move': move,
+                     'iterations': job.search.iterations, 'partial': not done, 'seconds': now - job.started,
+                     'worker': number, 'rounds': rounds, 'rollouts': rollouts}
+            replies.put(reply)
+        jobs = running
+
+
+# an asyncio service that answers move requests for many games at once
+# the searches run in a pool of worker processes (see service_worker), the games of a worker sharing its
+# rounds and its batches of rollouts. a game stays with the worker that got its first request, so its
+# trees carry over from move to move; a new game goes to the worker with the fewest searches running
+# backpressure: at most max_pending requests are taken at once, request_move() waits for a free place
+# and serve() stops reading a connection until there is one
+# deadlines are in milliseconds from the request, the time waiting for a place included
+class MoveService:
+    # service constructor. workers defaults to the number of cores, budget is the default iterations per move
+    # deadline the default deadline in milliseconds (None for none)
+    def __init__(self, workers=None, budget=BUDGET, batch=BATCH, max_pending=MAX_PENDING, deadline=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.budget = budget
+        self.batch = batch
+        self.max_pending = max_pending
+        self.deadline = deadline
+        self.processes = []
+        self.requests = []
+        self.replies = None
+        self.loop = None
+        self.places = None
+        self.ids = itertools.count()
+        # request id -> (future, worker)
+        self.running = {}
+        # game -> worker
+        self.games = {}
+        self.load = [0] * self.workers
+        self.waiting = 0
+        self.latencies = collections.deque(maxlen=LATENCY_WINDOW)
+        self.counts = collections.Counter()
+        self.worker_stats = {}
+        self.started = None
+
+    # start the worker processes and the thread that hands their replies to the event loop
+    async def start(self):
+        self.loop = asyncio.get_running_loop()
+        self.places = asyncio.Semaphore(self.max_pending)
+        context = multiprocessing.get_context('spawn')
+        self.replies = context.Queue()
+        for number in range(self.workers):
+            requests = context.Queue()
+            process = context.Process(target=service_worker, args=(number, requests, self.replies, self.batch))
+            process.daemon = True
+            process.start()
+            self.requests.append(requests)
+            self.processes.append(process)
+        self.listener = threading.Thread(target=self.listen)
+        self.listener.daemon = True
+        self.listener.start()
+        self.started = time.time()
+        return self
+
+    # runs in the listener thread
+    def listen(self):
+        while True:
+            message = self.replies.get()
+            if message is None:
+                break
+            self.loop.call_soon_threadsafe(self.deliver, message)
+
+    # runs in the event loop: resolve the future of a reply
+    def deliver(self, message):
+        self.worker_stats[message['worker']] = (message['rounds'], message['rollouts'])
+        entry = self.running.pop(message['id'], None)
+        if entry is None:
+            return
+        future, worker = entry
+        self.load[worker] -= 1
+        if not future.done():
+            future.set_result(message)
+
+    # the move of player on board in game (any hashable name), as a dict with 'move' ([row, column]),
+    # 'iterations', 'partial' (True if the deadline cut the search short) and 'latency' (seconds)
+    # budget and deadline (milliseconds) default to the service's. raises DeadlineExceeded
+    async def request_move(self, game, board, player, budget=None, deadline=None):
+        started = time.time()
+        deadline = deadline if deadline is not None else self.deadline
+        expires = started + deadline / 1000 if deadline is not None else None
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self.places.acquire(), expires - started if expires is not None else None)
+        except asyncio.TimeoutError:
+            self.counts['expired'] += 1
+            raise DeadlineExceeded("no place for the request of game {0}".format(game))
+        finally:
+            self.waiting -= 1
+        try:
+            return await self.search(game, board, player, budget, expires, started)
+        finally:
+            self.places.release()
+
+    # send a request to the worker of its game and wait for the reply. the caller holds a place
+    async def search(self, game, board, player, budget, expires, started):
+        if not board.get_options():
+            raise ValueError("no move left on the board of game {0}".format(game))
+        worker = self.games.get(game)
+        if worker is None:
+            worker = self.load.index(min(self.load))
+            self.games[game] = worker
+        number = next(self.ids)
+        future = self.loop.create_future()
+        self.running[number] = (future, worker)
+        self.load[worker] += 1
+        self.requests[worker].put({'kind': 'search', 'id': number, 'game': game, 'board': board.copy(),
+                                   'player': player, 'budget': budget or self.budget,
+                                   'deadline': expires if expires is not None else float('inf')})
+        try:
+            # the worker answers by the deadline, the extra second only covers a worker that is stuck
+            reply = await asyncio.wait_for(future, expires - time.time() + 1 if expires is not None else None)
+        except asyncio.TimeoutError:
+            reply = {'kind': 'expired'}
+        finally:
+            if self.running.pop(number, None) is not None:
+                self.load[worker] -= 1
+                self.requests[worker].put({'kind': 'cancel', 'id': number})
+        if reply['kind'] == 'expired':
+            self.counts['expired'] += 1
+            raise DeadlineExceeded("no move for game {0} by its deadline".format(game))
+        latency = time.time() - started
+        self.latencies.append(latency)
+        self.counts['partial' if reply['partial'] else 'completed'] += 1
+        return {'move': reply['move'], 'iterations': reply['iterations'], 'partial': reply['partial'],
+                'latency': latency}
+
+    # the game is over: its workers drop its trees
+    def end_game(self, game):
+        worker = self.games.pop(game, None)
+        if worker is not None:
+            self.requests[worker].put({'kind': 'forget', 'game': game})
+
+    # queue depth, latency percentiles (milliseconds) and throughput
+    def metrics(self):
+        latencies = sorted(self.latencies)
+        rounds = sum(stats[0] for stats in self.worker_stats.values())
+        rollouts = sum(stats[1] for stats in self.worker_stats.values())
+        elapsed = time.time() - self.started if self.started else 0
+        answered = self.counts['completed'] + self.counts['partial']
+        return {'waiting': self.waiting, 'running': len(self.running), 'per_worker': list(self.load),
+                'games': len(self.games), 'completed': self.counts['completed'], 'partial': self.counts['partial'],
+                'expired': self.counts['expired'],
+                'p50_ms': percentile(latencies, 0.5) * 1000, 'p99_ms': percentile(latencies, 0.99) * 1000,
+                'moves_per_second': answered / elapsed if elapsed else 0.0,
+                'rollouts_per_round': rollouts / rounds if rounds else 0.0}
+
+    # serve JSON lines over TCP until cancelled. a request is {"id", "game", "moves" (the [row, column] moves
+    # played so far, black first), "size", "length", "budget", "deadline"}, the last four optional, and gets
+    # {"id", "move", "iterations", "partial", "latency_ms"} or {"id", "error"}
+    # {"end": game} ends a game and {"metrics": true} gets the metrics. a line that is not a JSON object gets
+    # {"id": null, "error"}, and moves off the board or onto a taken spot an error too
+    async def serve(self, host='127.0.0.1', port=7000):
+        server = await asyncio.start_server(self.connection, host, port)
+        async with server:
+            await server.serve_forever()
+
+    async def connection(self, reader, writer):
+        tasks = set()
+        try:
+            while True:
+                # backpressure: the next line is only read once there is a place for it
+                await self.places.acquire()
+                line = await reader.readline()
+                if not line:
+                    self.places.release()
+                    break
+                task = asyncio.ensure_future(self.answer(line, writer))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        finally:
+            if tasks:
+                await asyncio.wait(tasks)
+            writer.close()
+
+    # answer one line of a connection. the caller holds a place
+    async def answer(self, line, writer):
+        started = time.time()
+        reply = {'id': None}
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("a request is a JSON object, not {0}".format(type(request).__name__))
+            reply['id'] = request.get('id')
+            if 'end' in request:
+                self.end_game(request['end'])
+            elif 'metrics' in request:
+                reply['metrics'] = self.metrics()
+            else:
+                board = GameConfig(request.get('size', 11), request.get('length', 5)).new_board()
+                piece = 'b'
+                for r, c in request['moves']:
+                    if not all(isinstance(x, int) and 0 <= x < board.size for x in (r, c)):
+                        raise ValueError("move {0} is off the {1}x{1} board".format([r, c], board.size))
+                    if not board.set_piece(r, c, piece):
+                        raise ValueError("move {0} is on a taken spot".format([r, c]))
+                    piece = 'w' if piece == 'b' else 'b'
+                deadline = request.get('deadline', self.deadline)
+                expires = started + deadline / 1000 if deadline is not None else None
+                result = await self.search(request['game'], board, piece, request.get('budget'), expires, started)
+                reply.update(move=result['move'], iterations=result['iterations'], partial=result['partial'],
+                             latency_ms=result['latency'] * 1000)
+        except DeadlineExceeded:
+            reply['error'] = 'deadline'
+        except (KeyError, TypeError, ValueError) as error:
+            reply['error'] = str(error)
+        finally:
+            self.places.release()
+        writer.write((json.dumps(reply) + '\n').encode())
+        await writer.drain()
+
+    # stop the workers
+    async def close(self):
+        for requests in self.requests:
+            requests.put(None)
+        for process in self.processes:
+            await self.loop.run_in_executor(None, process.join, 5)
+        self.replies.put(None)
+        self.listener.join(5)
+        self.processes = []
+
+
+# the q quantile of sorted values, 0 if there are none
+def percentile(values, q):
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+# the client side of MoveService.serve(), with the same request_move() as the service
+class MoveClient:
+    def __init__(self, host='127.0.0.1', port=7000):
+        self.host = host
+        self.port = port
+        self.ids = itertools.count()
+        self.futures = {}
+
+    async def start(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        self.receiver = asyncio.ensure_future(self.receive())
+        return self
+
+    async def receive(self):
+        while True:
+            line = await self.reader.readline()
+            if not line:
+                break
+            reply = json.loads(line)
+            future = self.futures.pop(reply['id'], None)
+            if future is not None and not future.done():
+                future.set_result(reply)
+
+    async def call(self, request):
+        request['id'] = next(self.ids)
+        future = asyncio.get_running_loop().create_future()
+        self.futures[request['id']] = future
+        self.writer.write((json.dumps(request) + '\n').encode())
+        await self.writer.drain()
+        return await future
+
+    async def request_move(self, game, board, player, budget=None, deadline=None):
+        request = {'game': game, 'moves': [list(board.coords(i)) for i in board.moves],
+                   'size': board.size, 'length': board.length}
+        if budget is not None:
+            request['budget'] = budget
+        if deadline is not None:
+            request['deadline'] = deadline
+        reply = await self.call(request)
+        if reply.get('error') == 'deadline':
+            raise DeadlineExceeded("no move for game {0} by its deadline".format(game))
+        if 'error' in reply:
+            raise ValueError(reply['error'])
+        return {'move': reply['move'], 'iterations': reply['iterations'], 'partial': reply['partial'],
+                'latency': reply['latency_ms'] / 1000}
+
+    def end_game(self, game):
+        self.writer.write((json.dumps({'id': None, 'end': game}) + '\n').encode())
+
+    async def metrics(self):
+        return (await self.call({'metrics': True}))['metrics']
+
+    async def close(self):
+        self.writer.close()
+        self.receiver.cancel()
+
+
+# load test: games games played at the same time, every move of both sides asked from service
+# (a MoveService or a MoveClient). a move that misses its deadline is played at random
+# the metrics are written to output every interval seconds
+async def load_test(service, games, plies, budget, deadline, size=11, length=5, seed=None, interval=1.0,
+                    output=sys.stderr):
+    rng = random.Random(seed)
+    missed = collections.Counter()
+
+    async def play(game):
+        board = GameConfig(size, length).new_board()
+        piece = 'b'
+        while len(board.moves) < plies and board.get_options():
+            try:
+                move = (await service.request_move(game, board, piece, budget, deadline))['move']
+            except DeadlineExceeded:
+                missed['moves'] += 1
+                move = rng.choice(board.get_options())
+            board.set_piece(move[0], move[1], piece)
+            if board.check_win(move[0], move[1]):
+                break
+            piece = 'w' if piece == 'b' else 'b'
+        service.end_game(game)
+
+    async def report():
+        while True:
+            await asyncio.sleep(interval)
+            metrics = service.metrics()
+            if asyncio.iscoroutine(metrics):
+                metrics = await metrics
+            output.write(json.dumps(metrics) + '\n')
+
+    reporter = asyncio.ensure_future(report())
+    started = time.time()
+    await asyncio.gather(*[play('game{0}'.format(game)) for game in range(games)])
+    reporter.cancel()
+    metrics = service.metrics()
+    if asyncio.iscoroutine(metrics):
+        metrics = await metrics
+    metrics.update(seconds=time.time() - started, missed=missed['moves'])
+    return metrics
+
+
+# requests a service must turn down, as (name, moves)
+BAD_MOVES = (('off the board', [[5, 5], [11, 0]]), ('negative', [[5, 5], [-1, 3]]),
+             ('not a number', [[5, 5], [4, 'x']]), ('taken spot', [[5, 5], [4, 4], [5, 5]]))
+
+
+# check the service's answers to BAD_MOVES, and to one good request, through a connection to it on a free
+# port. returns the names of the cases it got wrong, a request with no reply in timeout seconds among them
+async def check(service, host='127.0.0.1', timeout=10):
+    server = await asyncio.start_server(service.connection, host, 0)
+    client = await MoveClient(host, server.sockets[0].getsockname()[1]).start()
+    failed = []
+    cases = [(name, moves, 'error') for name, moves in BAD_MOVES] + [('good', [[5, 5]], 'move')]
+    try:
+        for name, moves, expected in cases:
+            try:
+                reply = await asyncio.wait_for(client.call({'game': name, 'moves': moves, 'budget': 10}), timeout)
+            except asyncio.TimeoutError:
+                reply = {}
+            if expected not in reply:
+                failed.append(name)
+    finally:
+        await client.close()
+        server.close()
+    return failed
+
+
+# command line tool, e.g.
+#   python service.py serve --port 7000 --workers 4
+#   python service.py load --games 32 --budget 400 --deadline 1000
+#   python service.py load --connect 127.0.0.1:7000 --games 32
+#   python service.py check             (exit status 1 if a bad request got a move)
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serve MCTS moves to many games at once, or load test it.")
+    parser.add_argument('command', choices=('serve', 'load', 'check'))
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=7000)
+    parser.add_argument('--connect', default=None, help="load test a running server (host:port) instead")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument('--batch', type=int, default=BATCH, help="rollouts per round of a worker")
+    parser.add_argument('--pending', type=int, default=MAX_PENDING, help="requests taken at once")
+    parser.add_argument('--games', type=int, default=16, help="games played at once by the load test")
+    parser.add_argument('--plies', type=int, default=20, help="moves per game of the load test")
+    parser.add_argument('--budget', type=int, default=400, help="MCTS iterations per move")
+    parser.add_argument('--deadline', type=int, default=None, help="milliseconds per move")
+    parser.add_argument('--size', type=int, default=11)
+    parser.add_argument('--length', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    async def main():
+        if args.connect:
+            host, _, port = args.connect.partition(':')
+            service = await MoveClient(host, int(port)).start()
+        else:
+            service = await MoveService(args.workers, args.budget, args.batch, args.pending, args.deadline).start()
+        try:
+            if args.command == 'serve':
+                await service.serve(args.host, args.port)
+            elif args.command == 'check':
+                failed = await check(service, args.host)
+                print(json.dumps({'cases': len(BAD_MOVES) + 1, 'failed': failed}))
+                return bool(failed)
+            else:
+                print(json.dumps(await load_test(service, args.games, args.plies, args.budget, args.deadline,
+                                                 args.size, args.length, args.seed)))
+        finally:
+            await service.close()
+
+    if asyncio.run(main()):
+        sys.exit(1)
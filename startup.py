@@ -0,0 +1,138 @@
+from __future__ import absolute_import, division, print_function
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+
+# the modules a tool that only plays (or serves) games imports, which should stay light
+ENGINE = ('bitboard', 'config', 'randplay', 'mcts', 'searchworker', 'book', 'tournament', 'service')
+# and the GUI, which loads pygame on purpose
+GUI = ('board',)
+# the imports the engine modules should not pull in
+HEAVY = ('numpy', 'pygame')
+# run in a fresh interpreter: time one import and list the heavy modules it loaded
+PROBE = ("import sys, time, json; started = time.perf_counter(); import {0}; "
+         "print(json.dumps([time.perf_counter() - started, [name for name in {1!r} if name in sys.modules]]))")
+
+
+# the seconds a fresh interpreter takes to import module, measured inside it (the interpreter's own start is
+# the 'interpreter' case), and the heavy modules the import loaded
+def import_time(module):
+    # the engine modules are imported from here, wherever the tool is started from
+    output = subprocess.check_output([sys.executable, '-c', PROBE.format(module, HEAVY)],
+                                     cwd=os.path.dirname(os.path.abspath(__file__)))
+    # pygame greets on stdout, the probe's line is the last one
+    seconds, heavy = json.loads(output.decode().splitlines()[-1])
+    return seconds, heavy
+
+
+# the seconds from starting a python that does nothing to its exit
+def interpreter_time():
+    started = time.perf_counter()
+    subprocess.check_call([sys.executable, '-c', 'pass'])
+    return time.perf_counter() - started
+
+
+# the seconds from asking a new BackgroundSearch for a move to the move: a spawned worker's interpreter
+# start and imports, and a one iteration search
+def searchworker_time():
+    from config import GameConfig
+    from searchworker import BackgroundSearch
+    done = threading.Event()
+
+    def deliver(message):
+        if message['kind'] == 'move':
+            done.set()
+
+    search = BackgroundSearch(deliver, budget=1)
+    started = time.perf_counter()
+    search.search(GameConfig().new_board(), 'b')
+    done.wait()
+    seconds = time.perf_counter() - started
+    search.close()
+    return seconds
+
+
+# the same for a new MoveService with one worker
+def service_time():
+    import asyncio
+    from config import GameConfig
+    from service import MoveService
+
+    async def first_move():
+        started = time.perf_counter()
+        service = await MoveService(workers=1, budget=1).start()
+        await service.request_move('startup', GameConfig().new_board(), 'b')
+        seconds = time.perf_counter() - started
+        await service.close()
+        return seconds
+
+    return asyncio.run(first_move())
+
+
+# time every case rounds times. the report has the same shape as benchmark.py's, so that
+# benchmark.regressions() can compare two of them; an import case also lists the heavy modules it loaded
+def run(rounds=5, output=sys.stderr):
+    cases = [('interpreter', interpreter_time)]
+    cases += [('import/' + module, lambda module=module: import_time(module)) for module in ENGINE + GUI]
+    cases += [('spawn/searchworker', searchworker_time), ('spawn/service', service_time)]
+    results = {}
+    for name, function in cases:
+        times = []
+        heavy = []
+        for round in range(rounds):
+            result = function()
+            if isinstance(result, tuple):
+                result, heavy = result
+            times.append(result)
+        times.sort()
+        results[name] = {'best': times[0], 'median': times[len(times) // 2], 'calls': 1}
+        if name.startswith('import/'):
+            results[name]['heavy'] = heavy
+        output.write("{0:24} {1:10.1f} ms {2}\n".format(name, times[0] * 1000, ' '.join(heavy)))
+    return {'python': platform.python_version(), 'machine': platform.machine(), 'time': time.time(),
+            'cases': results}
+
+
+# the engine modules whose import loaded a heavy module
+def heavy_imports(report):
+    return [module for module in ENGINE if report['cases']['import/' + module]['heavy']]
+
+
+# command line entry point, e.g.
+#   python startup.py --output baseline.json
+#   python startup.py --compare baseline.json
+# the exit status is 1 if an engine module imports numpy or pygame, or with --compare if a case got slower
+# run python -m compileall . first where the bytecode is not written on import, or every import compiles
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Time the imports of the engine and the start of its workers.")
+    parser.add_argument('--rounds', type=int, default=5, help="runs of each case")
+    parser.add_argument('--output', default=None, help="file for the JSON report (default: stdout)")
+    parser.add_argument('--compare', default=None, help="baseline JSON report to check for regressions")
+    parser.add_argument('--threshold', type=float, default=0.25, help="slowdown that counts as a regression")
+    args = parser.parse_args()
+    report = run(args.rounds)
+    if args.output:
+        with open(args.output, 'w') as stream:
+            json.dump(report, stream, indent=2, sort_keys=True)
+    else:
+        print(json.dumps(report, indent=2, sort_keys=True))
+    failed = False
+    heavy = heavy_imports(report)
+    if heavy:
+        sys.stderr.write("heavy imports in: {0}\n".format(', '.join(heavy)))
+        failed = True
+    if args.compare:
+        from benchmark import regressions
+        with open(args.compare) as stream:
+            baseline = json.load(stream)
+        slower = regressions(report, baseline, args.threshold)
+        if slower:
+            sys.stderr.write("{0} regression(s): {1}\n".format(len(slower), ', '.join(name for name, _ in slower)))
+            failed = True
+    if failed:
+        sys.exit(1)
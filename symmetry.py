@@ -0,0 +1,178 @@
+from __future__ import absolute_import, division, print_function
+from zobrist import default_keys
+
+
+# the 8 symmetries of a square board (the identity, three rotations and four reflections)
+# as functions of (r, c) on a board whose largest row or column index is m
+TRANSFORMS = (
+    lambda r, c, m: (r, c),
+    lambda r, c, m: (c, m - r),
+    lambda r, c, m: (m - r, m - c),
+    lambda r, c, m: (m - c, r),
+    lambda r, c, m: (r, m - c),
+    lambda r, c, m: (m - r, c),
+    lambda r, c, m: (c, r),
+    lambda r, c, m: (m - c, m - r),
+)
+
+
+# the symmetries of a board of the given size as permutations of the BitBoard bit indices, and the
+# canonical key of a position: the smallest of the Zobrist hashes of its 8 images, so that a position,
+# its rotations and its mirror images all get the same key
+class Symmetries:
+    # constructor. zobrist is the ZobristKeys of the boards
+    def __init__(self, size, zobrist):
+        self.size = size
+        self.stride = size + 1
+        self.zobrist = zobrist
+        # image[t][i]: the index spot i is moved to by symmetry t, inverse[t] the way back
+        self.image = []
+        self.inverse = []
+        for transform in TRANSFORMS:
+            image = [0] * (size * self.stride)
+            inverse = [0] * (size * self.stride)
+            for r in range(size):
+                for c in range(size):
+                    new_r, new_c = transform(r, c, size - 1)
+                    image[r * self.stride + c] = new_r * self.stride + new_c
+                    inverse[new_r * self.stride + new_c] = r * self.stride + c
+            self.image.append(image)
+            self.inverse.append(inverse)
+        # keys[t][color][i]: the Zobrist key of a piece of color on spot i after symmetry t
+        self.keys = [dict((color, [zobrist.keys[color][j] for j in image]) for color in ('b', 'w'))
+                     for image in self.image]
+
+    # the canonical key of board with player to move, and the symmetry that maps board onto the canonical
+    # position, as (key, t)
+    def canonical(self, board, player):
+        best, best_t = None, 0
+        pieces = [(color, board.indices(board.bits[color])) for color in ('b', 'w')]
+        for t, keys in enumerate(self.keys):
+            key = 0
+            for color, indices in pieces:
+                color_keys = keys[color]
+                for i in indices:
+                    key ^= color_keys[i]
+            if best is None or key < best:
+                best, best_t = key, t
+        if player == 'w':
+            best ^= self.zobrist.side
+        return best, best_t
+
+    # the symmetries other than the identity that map board onto itself, pieces and colors alike
+    # a symmetry usually fails on one of the first pieces looked at, so this is cheap on the positions
+    # that have none, which is nearly all of them after the opening
+    def stabilizer(self, board):
+        black, white = board.bits['b'], board.bits['w']
+        pieces = [(i, black) for i in board.indices(black)] + [(i, white) for i in board.indices(white)]
+        found = []
+        for t in range(1, len(TRANSFORMS)):
+            image = self.image[t]
+            for i, own in pieces:
+                if not (own >> image[i]) & 1:
+                    break
+            else:
+                found.append(t)
+        return found
+
+    # the moves (a list of (r, c)) with one move left of every set of moves that the symmetries of board
+    # map onto each other: the one with the smallest index. the order of the moves is kept
+    def distinct_moves(self, board, moves):
+        group = self.stabilizer(board)
+        if not group:
+            return moves
+        images = [self.image[t] for t in group]
+        stride = self.stride
+        distinct = []
+        for move in moves:
+            i = move[0] * stride + move[1]
+            if all(image[i] >= i for image in images):
+                distinct.append(move)
+        return distinct
+
+    # (r, c) moved by symmetry t
+    def apply(self, t, r, c):
+        return divmod(self.image[t][r * self.stride + c], self.stride)
+
+    # (r, c) moved back by symmetry t
+    def invert(self, t, r, c):
+        return divmod(self.inverse[t][r * self.stride + c], self.stride)
+
+
+# symmetries are only tables, so boards of the same size share the default ones
+defaults = {}
+
+
+def default_symmetries(size):
+    if size not in defaults:
+        defaults[size] = Symmetries(size, default_keys(size))
+    return defaults[size]
+
+
+# the symmetric openings of the benchmark below, as the moves played from the empty 11x11 board, black first
+OPENINGS = (
+    ((5, 5),),
+    ((5, 5), (5, 6)),
+    ((5, 5), (4, 4)),
+    ((5, 5), (4, 5), (6, 5)),
+)
+
+
+# the move of a class of moves that the symmetries of board map onto each other, see distinct_moves
+def representative(symmetries, board, move):
+    i = move[0] * symmetries.stride + move[1]
+    return divmod(min([i] + [symmetries.image[t][i] for t in symmetries.stabilizer(board)]), symmetries.stride)
+
+
+# benchmark: how much budget merging the symmetric moves saves in the opening. for each opening and budget,
+# plain and symmetry-aware MCTS search seeds times each. reported are the iterations behind each distinct root
+# move, and the regret of the chosen move: how much less its class of moves is worth than the best class, by
+# the values of a symmetry-aware search of the reference budget. the effective budget of a symmetry-aware
+# search is the smallest budget at which plain searches have no more regret
+if __name__ == '__main__':
+    import argparse
+    import random
+    import sys
+    import time
+    from config import GameConfig
+    from mcts import MCTS
+    parser = argparse.ArgumentParser(description="Measure the budget that symmetry-aware MCTS saves in the opening.")
+    parser.add_argument('--budgets', type=int, nargs='+', default=[100, 200, 400, 800])
+    parser.add_argument('--seeds', type=int, default=10, help="searches per opening, budget and kind")
+    parser.add_argument('--reference', type=int, default=6400, help="budget of the search that values the moves")
+    args = parser.parse_args()
+    symmetries = default_symmetries(11)
+    print("{0:16} {1:>6} {2:>18} {3:>15} {4:>10} {5:>10}".format(
+        'opening', 'budget', 'visits per move', 'regret', 'time ratio', 'effective'))
+    for opening in OPENINGS:
+        board = GameConfig().new_board()
+        piece = 'b'
+        for r, c in opening:
+            board.set_piece(r, c, piece)
+            piece = 'w' if piece == 'b' else 'b'
+        random.seed(0)
+        reference = MCTS(board, piece, budget=args.reference, symmetry=True)
+        reference.uct_search()
+        values = dict((reference.child_move(reference.root, child), child.win / child.encounter)
+                      for child in reference.root.children)
+        top = max(values.values())
+        results = {}
+        for symmetry in (False, True):
+            for budget in args.budgets:
+                regret, visits, seconds = 0.0, 0.0, 0.0
+                for seed in range(args.seeds):
+                    random.seed(seed + 1)
+                    search = MCTS(board, piece, budget=budget, symmetry=symmetry)
+                    started = time.time()
+                    move = search.uct_search()
+                    seconds += time.time() - started
+                    regret += top - values[representative(symmetries, board, move)]
+                    visits += search.root.encounter / len(search.root.children)
+                results[symmetry, budget] = (regret / args.seeds, visits / args.seeds, seconds)
+        for budget in args.budgets:
+            plain, sym = results[False, budget], results[True, budget]
+            effective = [other for other in args.budgets if results[False, other][0] <= sym[0]]
+            print("{0:16} {1:6} {2:8.0f} ->{3:6.0f} {4:6.3f} ->{5:6.3f} {6:10.2f} {7:>10}".format(
+                ' '.join("{0},{1}".format(r, c) for r, c in opening), budget, plain[1], sym[1], plain[0], sym[0],
+                sym[2] / plain[2], effective[0] if effective else '>' + str(args.budgets[-1])))
+        sys.stdout.flush()
@@ -0,0 +1,220 @@
+from __future__ import absolute_import, division, print_function
+import argparse
+import itertools
+import json
+import multiprocessing
+import random
+import sys
+import time
+from math import log10
+from book import Book
+from config import GameConfig
+from gamerecord import RecordWriter
+from mcts import MCTS, WIDENING
+from nodepool import NodePool
+from prior import ThreatPrior
+from policy import POLICIES
+from randplay import Randplay
+
+# the MCTS options an agent spec can set, and how to read their values
+MCTS_OPTIONS = {'budget': int, 'time': int, 'batch': int, 'early': int, 'reuse': int, 'policy': str,
+                'prior': int, 'widen': int, 'book': str, 'sym': int, 'nodes': int}
+# the opening books opened by this process, by path. they are only read, so the games share them
+books = {}
+
+
+def open_book(path):
+    if path not in books:
+        books[path] = Book(path, read_only=True)
+    return books[path]
+
+
+# a player in a headless game. built from a spec string:
+#   'random'                        the random player
+#   'mcts' or 'mcts:400'            MCTS with the default or the given iteration budget
+#   'mcts:time=500,batch=64'        MCTS with options: budget, time (milliseconds per move),
+#                                   batch (batched rollouts), early (early stopping), reuse (keep the tree),
+#                                   policy (rollout policy: random or threat), prior (threat prior with PUCT),
+#                                   widen (progressive widening), book (path of an opening book, see book.py),
+#                                   sym (merge the moves that are the same by symmetry),
+#                                   nodes (the most nodes the tree may have, see nodepool.py)
+class Agent:
+    # agent constructor from a spec string
+    def __init__(self, spec):
+        self.spec = spec
+        name, _, options = spec.partition(':')
+        if name not in ('random', 'mcts'):
+            raise ValueError("unknown agent: {0}".format(spec))
+        self.name = name
+        self.options = {}
+        for option in filter(None, options.split(',')):
+            key, _, value = option.partition('=')
+            if not value:
+                key, value = 'budget', key
+            if name != 'mcts' or key not in MCTS_OPTIONS:
+                raise ValueError("unknown option {0} in agent {1}".format(key, spec))
+            self.options[key] = MCTS_OPTIONS[key](value)
+        if self.options.get('policy', 'random') not in POLICIES:
+            raise ValueError("unknown rollout policy in agent {0}".format(spec))
+        for key in ('budget', 'time', 'batch', 'nodes'):
+            if key in self.options and self.options[key] < 1:
+                raise ValueError("option {0} of agent {1} must be at least 1".format(key, spec))
+        self.search = None
+        if name == 'mcts':
+            # whatever else the search would reject, it rejects here and not in a worker
+            self.new_search(GameConfig().new_board(), 'b')
+
+    # forget the tree kept from the last game
+    def reset(self):
+        self.search = None
+
+    # the move of piece on board
+    def choose(self, board, piece):
+        if self.name == 'random':
+            return Randplay(board, piece).make_move()
+        if self.search is not None:
+            self.search.update(board)
+            search = self.search
+        else:
+            search = self.new_search(board, piece)
+            if self.options.get('reuse'):
+                self.search = search
+        return search.uct_search()
+
+    # an MCTS with the agent's options, to play piece on board
+    def new_search(self, board, piece):
+        options = self.options
+        policy = options.get('policy')
+        return MCTS(board, piece, budget=options.get('budget'), time_limit=options.get('time'),
+                    early_stop=bool(options.get('early')), batch=options.get('batch'),
+                    policy=POLICIES[policy]() if policy else None,
+                    prior=ThreatPrior() if options.get('prior') else None,
+                    widening=WIDENING if options.get('widen') else None,
+                    book=open_book(options['book']) if options.get('book') else None,
+                    symmetry=bool(options.get('sym')),
+                    pool=NodePool(max_nodes=options['nodes']) if options.get('nodes') else None)
+
+
+# play one game without any graphics. returns a dict describing it, with the moves as (row, column) pairs
+# the board is size x size and length pieces in a row win
+def play_game(black, white, seed=None, size=11, length=5):
+    random.seed(seed)
+    agents = {'b': Agent(black), 'w': Agent(white)}
+    board = GameConfig(size, length).new_board()
+    piece = 'b'
+    winner = 'd'
+    started = time.time()
+    while board.get_options():
+        r, c = agents[piece].choose(board, piece)
+        board.set_piece(r, c, piece)
+        if board.check_win(r, c):
+            winner = piece
+            break
+        piece = 'w' if piece == 'b' else 'b'
+    return {'type': 'game', 'black': black, 'white': white, 'winner': winner, 'seed': seed,
+            'size': size, 'length': length, 'plies': len(board.moves), 'seconds': time.time() - started,
+            'moves': [list(board.coords(i)) for i in board.moves]}
+
+
+# runs in a worker process
+def play_task(task):
+    return play_game(*task)
+
+
+# Bradley-Terry ratings from the pairwise results, on the Elo scale with an average of 0
+# scores[a][b] is a's points against b (a draw is half a point), games[a][b] the number of games they played
+# every pair that met gets one extra virtual draw, so that an agent that never won still gets a finite rating
+def elo_ratings(agents, scores, games):
+    strength = dict((agent, 1.0) for agent in agents)
+    for iteration in range(200):
+        updated = {}
+        for a in agents:
+            points, weight = 0.0, 0.0
+            for b in agents:
+                if a != b and games[a][b]:
+                    points += scores[a][b] + 0.5
+                    weight += (games[a][b] + 1) / (strength[a] + strength[b])
+            updated[a] = points / weight if weight else 1.0
+        strength = updated
+    ratings = dict((agent, 400 * log10(strength[agent])) for agent in agents)
+    mean = sum(ratings.values()) / len(ratings)
+    return dict((agent, rating - mean) for agent, rating in ratings.items())
+
+
+# plays games games for every pair of agents (half of them with each color) on a pool of workers,
+# writing every finished game to output as a JSON line, followed by one summary line, and to record
+# (a gamerecord.RecordWriter) if there is one. returns the summary
+def run_tournament(agents, games, workers=None, seed=None, size=11, length=5, output=sys.stdout, record=None):
+    if len(set(agents)) != len(agents):
+        raise ValueError("every agent must appear once")
+    for spec in agents:
+        Agent(spec)  # fail early on a bad spec, not in a worker
+    GameConfig(size, length)  # and on rules that cannot be played
+    rng = random.Random(seed)
+    tasks = []
+    for a, b in itertools.combinations(agents, 2):
+        for game in range(games):
+            black, white = (a, b) if game % 2 == 0 else (b, a)
+            tasks.append((black, white, rng.getrandbits(32), size, length))
+    scores = dict((a, dict((b, 0.0) for b in agents)) for a in agents)
+    played = dict((a, dict((b, 0) for b in agents)) for a in agents)
+    started = time.time()
+    pool = multiprocessing.Pool(workers or multiprocessing.cpu_count())
+    try:
+        for result in pool.imap_unordered(play_task, tasks):
+            output.write(json.dumps(result) + '\n')
+            output.flush()
+            if record is not None:
+                record.write(result['moves'], result['winner'])
+            black, white = result['black'], result['white']
+            played[black][white] += 1
+            played[white][black] += 1
+            if result['winner'] == 'b':
+                scores[black][white] += 1
+            elif result['winner'] == 'w':
+                scores[white][black] += 1
+            else:
+                scores[black][white] += 0.5
+                scores[white][black] += 0.5
+    finally:
+        pool.close()
+        pool.join()
+    elapsed = time.time() - started
+    ratings = elo_ratings(agents, scores, played)
+    summary = {'type': 'summary', 'size': size, 'length': length, 'games': len(tasks), 'seconds': elapsed,
+               'games_per_second': len(tasks) / elapsed if elapsed else 0.0, 'agents': {}}
+    for agent in agents:
+        total = sum(played[agent].values())
+        points = sum(scores[agent].values())
+        summary['agents'][agent] = {'games': total, 'score': points / total if total else 0.0,
+                                    'elo': ratings[agent]}
+    output.write(json.dumps(summary) + '\n')
+    output.flush()
+    return summary
+
+
+# command line entry point, e.g. python tournament.py random mcts:400 --games 100
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Play headless Gomoku matches between agents.")
+    parser.add_argument('agents', nargs='+', help="agent specs, e.g. random, mcts:400, mcts:time=500,batch=64")
+    parser.add_argument('--games', type=int, default=10, help="games per pair of agents")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument('--seed', type=int, default=None, help="seed for reproducible matches")
+    parser.add_argument('--size', type=int, default=11, help="board size")
+    parser.add_argument('--length', type=int, default=5, help="pieces in a row that win")
+    parser.add_argument('--output', default=None, help="file for the JSON lines (default: stdout)")
+    parser.add_argument('--record', default=None, help="game record file to add the games to, see gamerecord.py")
+    args = parser.parse_args()
+    if len(args.agents) < 2:
+        parser.error("at least two agents are needed")
+    stream = open(args.output, 'w') if args.output else sys.stdout
+    record = RecordWriter(args.record, args.size, args.length, append=True) if args.record else None
+    if record is not None and (record.size, record.length) != (args.size, args.length):
+        parser.error("{0} holds games of other rules".format(args.record))
+    try:
+        run_tournament(args.agents, args.games, args.workers, args.seed, args.size, args.length, stream, record)
+    finally:
+        if args.output:
+            stream.close()
+        if record is not None:
+            record.close()
@@ -0,0 +1,54 @@
+from __future__ import absolute_import, division, print_function
+import sys
+from collections import OrderedDict
+
+
+# a bounded table from position keys (Zobrist hash and player to move) to the search tree's State nodes
+# the MCTS looks every new child up here first. if the same pieces were already reached through a
+# different order of moves, the existing node is shared instead of creating a duplicate, so both paths
+# add to the same visits and wins and the tree becomes a DAG
+# when the table is full the least recently used entry is dropped. a dropped node stays in the tree,
+# it just stops being shared with positions found later
+class TranspositionTable:
+    # table constructor. capacity is the maximum number of entries
+    def __init__(self, capacity=100000):
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # the node stored for key, or None. a hit makes the entry the most recently used one
+    def get(self, key):
+        node = self.entries.get(key)
+        if node is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return node
+
+    # store a node, dropping the least recently used entry if the table is full
+    def store(self, key, node):
+        self.entries[key] = node
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    # forget everything, e.g. between games
+    def clear(self):
+        self.entries.clear()
+
+    # numbers to tune the table with. bytes only counts the table itself, not the nodes it points to
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self.entries),
+            'capacity': self.capacity,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+            'bytes': sys.getsizeof(self.entries) + sum(sys.getsizeof(key) for key in self.entries),
+        }
@@ -0,0 +1,88 @@
+from __future__ import absolute_import, division, print_function
+
+# (row step, column step) of the four lines through a spot: horizontal, vertical and the two diagonals
+DIRECTIONS = ((0, 1), (1, 0), (1, 1), (1, -1))
+
+
+# the one five-in-a-row rule used by the BitBoard, the GUI board, the MCTS states and the random player
+# for every spot the tables hold the four line segments through it that can contain a winning run
+# (length - 1 spots on each side), as bit masks in the BitBoard layout, plus the shift for each line.
+# "did this move win?" is then an and with the segment followed by a few shift-and steps per line:
+# y & (y >> d) keeps the pieces whose neighbour in direction d is set, i.e. runs of two,
+# repeating it with doubled shifts grows the runs to the winning length
+class WinDetector:
+    # detector constructor. builds the tables for a board of the given size and winning length
+    def __init__(self, size=11, length=5):
+        self.size = size
+        self.stride = size + 1
+        self.length = length
+        # the run lengths grow 1 -> 2 -> 4 -> ... -> length, each step adds at most the current span
+        steps = []
+        span = 1
+        while span < length:
+            step = min(span, length - span)
+            steps.append(step)
+            span += step
+        self.steps = tuple(steps)
+        # per spot, a tuple of (segment mask, shifts) for every line through it long enough to win on
+        self.lines = []
+        for r in range(size):
+            for c in range(size):
+                lines = []
+                for dr, dc in DIRECTIONS:
+                    segment = 0
+                    count = 0
+                    for k in range(-(length - 1), length):
+                        new_r, new_c = r + dr * k, c + dc * k
+                        if 0 <= new_r < size and 0 <= new_c < size:
+                            segment |= 1 << (new_r * self.stride + new_c)
+                            count += 1
+                    if count >= length:
+                        d = dr * self.stride + dc
+                        lines.append((segment, tuple(d * step for step in self.steps)))
+                self.lines.append(tuple(lines))
+            # keep the list indexed by bit index, the spare column never holds a piece
+            self.lines.append(())
+
+    # checks if the piece on bit i is part of a winning run among the pieces in x (one color's bits)
+    def is_win(self, x, i):
+        for segment, shifts in self.lines[i]:
+            y = x & segment
+            for shift in shifts:
+                y &= y >> shift
+            if y:
+                return True
+        return False
+
+    # the two ends ((r, c), (r, c)) of the longest line of pieces in x through (r, c)
+    # that is at least as long as the winning length, or None if there is none
+    def winning_line(self, x, r, c):
+        best = None
+        for dr, dc in DIRECTIONS:
+            back = self.count(x, r, c, -dr, -dc)
+            forward = self.count(x, r, c, dr, dc)
+            if back + forward + 1 >= self.length and (best is None or back + forward > best[0]):
+                best = (back + forward, (r - dr * back, c - dc * back), (r + dr * forward, c + dc * forward))
+        if best is None:
+            return None
+        return best[1], best[2]
+
+    # count the number of pieces in x next to (r, c) in a certain direction
+    def count(self, x, r, c, dr, dc):
+        result = 0
+        new_r, new_c = r + dr, c + dc
+        while 0 <= new_r < self.size and 0 <= new_c < self.size and (x >> (new_r * self.stride + new_c)) & 1:
+            result += 1
+            new_r += dr
+            new_c += dc
+        return result
+
+
+# detectors are only tables, so boards of the same size share the default one
+defaults = {}
+
+
+def default_detector(size, length=5):
+    if (size, length) not in defaults:
+        defaults[size, length] = WinDetector(size, length)
+    return defaults[size, length]
@@ -0,0 +1,27 @@
+from __future__ import absolute_import, division, print_function
+import random
+
+
+# Zobrist hashing: every (color, spot) gets a random 64 bit key, and a position's hash is the xor of the keys
+# of its pieces. setting or taking back a piece is one xor, so the BitBoard keeps its hash up to date for free
+# the keys come from a fixed seed, so the same position has the same hash in every process and every run
+class ZobristKeys:
+    # keys constructor for a board of the given size, indexed like the BitBoard bits
+    def __init__(self, size=11):
+        rng = random.Random(size)
+        stride = size + 1
+        self.size = size
+        self.keys = {'b': [rng.getrandbits(64) for _ in range(size * stride)],
+                     'w': [rng.getrandbits(64) for _ in range(size * stride)]}
+        # mixed in when white is to move, so that the same pieces with a different player to move differ
+        self.side = rng.getrandbits(64)
+
+
+# keys are only tables, so boards of the same size share the default ones
+defaults = {}
+
+
+def default_keys(size):
+    if size not in defaults:
+        defaults[size] = ZobristKeys(size)
+    return defaults[size]